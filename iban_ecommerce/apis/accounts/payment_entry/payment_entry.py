@@ -1,40 +1,60 @@
 import frappe
-from frappe.utils import nowdate
+from frappe.utils import cint, cstr, flt, nowdate
 from erpnext.accounts.doctype.payment_entry.payment_entry import get_payment_entry
+from iban_ecommerce.utils.metrics import instrument, phase
+from iban_ecommerce.utils.schema import compile_schema
+
+# 📦 Captures processed per transaction by create_payment_entries_bulk (0 = one transaction)
+DEFAULT_BULK_CHUNK_SIZE = 100
+
+# ✅ Payload schemas, compiled once at import
+PAYMENT_SCHEMA = compile_schema({
+    "order_id": {"type": "code", "required": True},
+    "mode_of_payment": {"type": "string", "required": True},
+    "amount": {"type": "number", "gt": 0},
+    "reference": {"type": "code"},
+})
+BULK_PAYMENTS_SCHEMA = compile_schema({
+    "payments": {"type": "list", "required": True, "min_items": 1},
+    "chunk_size": {"type": "integer"},
+})
 
 @frappe.whitelist()
+@instrument("create_payment_entry")
 def create_payment_entry(order_id=None):
     try:
         # 📥 Parse input data
         data = frappe.request.get_json()
-        order_id = data.get("order_id")
-        mode_of_payment = data.get("mode_of_payment")
-
-        if not order_id or not mode_of_payment:
+        errors = PAYMENT_SCHEMA(data)
+        if errors:
             return {
                 "Status": "Failure",
-                "Message": "Both 'order_id' and 'mode_of_payment' are required."
+                "Message": "; ".join(errors)
             }
 
-        # 🔍 Find the Sales Order
-        sales_order = frappe.db.get_value("Sales Order", {"po_no": order_id}, "name")
-        if not sales_order:
-            return {
-                "Status": "Failure",
-                "Message": f"No Sales Order found for ID: {order_id}"
-            }
+        order_id = data.get("order_id")
+        mode_of_payment = data.get("mode_of_payment")
+
+        with phase("resolution"):
+            # 🔍 Find the Sales Order
+            sales_order = frappe.db.get_value("Sales Order", {"po_no": order_id, "docstatus": ["<", 2]}, "name")
+            if not sales_order:
+                return {
+                    "Status": "Failure",
+                    "Message": f"No Sales Order found for ID: {order_id}"
+                }
 
-        # 🔍 Find the linked submitted Sales Invoice with outstanding amount
-        invoice_row = frappe.db.sql("""
-            SELECT si.name
-            FROM `tabSales Invoice` si
-            JOIN `tabSales Invoice Item` sii ON si.name = sii.parent
-            WHERE 
-                sii.sales_order = %s
-                AND si.docstatus = 1
-                AND si.outstanding_amount > 0
-            LIMIT 1
-        """, (sales_order,), as_dict=True)
+            # 🔍 Find the linked submitted Sales Invoice with outstanding amount
+            invoice_row = frappe.db.sql("""
+                SELECT si.name
+                FROM `tabSales Invoice` si
+                JOIN `tabSales Invoice Item` sii ON si.name = sii.parent
+                WHERE 
+                    sii.sales_order = %s
+                    AND si.docstatus = 1
+                    AND si.outstanding_amount > 0
+                LIMIT 1
+            """, (sales_order,), as_dict=True)
 
         if not invoice_row:
             return {
@@ -45,19 +65,8 @@ def create_payment_entry(order_id=None):
         invoice_name = invoice_row[0].name
 
         # 🧾 Create Payment Entry from the Sales Invoice
-        payment_entry = get_payment_entry("Sales Invoice", invoice_name)
-
-        # 🪙 Set missing fields
-        payment_entry.mode_of_payment = mode_of_payment
-        payment_entry.reference_no = invoice_name
-        payment_entry.reference_date = nowdate()
-
-        # Allow creation even if user lacks permission (for API usage)
-        payment_entry.ignore_permissions = True
-
-        # 💾 Save and submit
-        payment_entry.insert()
-        payment_entry.submit()
+        with phase("insert"):
+            payment_entry = make_payment_entry(invoice_name, mode_of_payment)
 
         return {
             "status": "Success",
@@ -68,3 +77,154 @@ def create_payment_entry(order_id=None):
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Auto Create Payment Entry Error")
         return {"status": "Failure", "error": str(e)}
+
+
+@frappe.whitelist()
+@instrument("create_payment_entries_bulk")
+def create_payment_entries_bulk():
+    # 📥 Accept either {"payments": [...], "chunk_size": n} or a bare list of captures
+    data = frappe.request.get_json()
+    if isinstance(data, list):
+        data = {"payments": data}
+    errors = BULK_PAYMENTS_SCHEMA(data)
+    if errors:
+        frappe.throw("; ".join(errors))
+
+    captures = data["payments"]
+    chunk_size = DEFAULT_BULK_CHUNK_SIZE
+    if data.get("chunk_size") is not None:
+        chunk_size = cint(data.get("chunk_size"))
+    if chunk_size <= 0:
+        chunk_size = len(captures)
+
+    results = [None] * len(captures)
+    pending = []
+
+    # ✅ Validate every capture up front, all problems of a capture are reported together
+    for idx, capture in enumerate(captures):
+        errors = PAYMENT_SCHEMA(capture)
+        if errors:
+            results[idx] = capture_result(idx, capture, "Failure", message="; ".join(errors))
+        else:
+            pending.append((idx, capture))
+
+    # 🔍 Resolve every order's invoices and every known reference in two queries
+    with phase("resolution"):
+        orders = get_order_invoices([capture["order_id"] for _, capture in pending])
+        recorded = get_recorded_references([capture.get("reference") for _, capture in pending])
+
+    for chunk_start in range(0, len(pending), chunk_size):
+        for idx, capture in pending[chunk_start:chunk_start + chunk_size]:
+            reference = cstr(capture.get("reference"))
+
+            # ♻️ Replayed settlement lines are reported instead of paid twice
+            if reference and reference in recorded:
+                results[idx] = capture_result(idx, capture, "Skipped", payment_entry=recorded[reference], message="Payment already recorded.")
+                continue
+
+            order = orders.get(cstr(capture["order_id"]).casefold())
+            if not order:
+                results[idx] = capture_result(idx, capture, "Failure", message=f"No Sales Order found for ID: {capture['order_id']}")
+                continue
+
+            invoice = next((inv for inv in order["invoices"] if inv["outstanding_amount"] > 0), None)
+            if not invoice:
+                if order["invoices"]:
+                    results[idx] = capture_result(idx, capture, "Skipped", message=f"Sales Order {order['sales_order']} is already paid.")
+                else:
+                    results[idx] = capture_result(idx, capture, "Failure", message=f"No Submitted Sales Invoice found linked to Sales Order {order['sales_order']}")
+                continue
+
+            amount = flt(capture.get("amount")) or None
+            frappe.db.savepoint("bulk_payment_entry")
+            try:
+                with phase("insert"):
+                    payment_entry = make_payment_entry(invoice["name"], capture["mode_of_payment"], reference or None, amount)
+            except Exception as e:
+                frappe.db.rollback(save_point="bulk_payment_entry")
+                frappe.clear_messages()
+                results[idx] = capture_result(idx, capture, "Failure", invoice=invoice["name"], message=str(e))
+                continue
+
+            # Later captures in the same file see what this one already paid
+            invoice["outstanding_amount"] -= min(amount or invoice["outstanding_amount"], invoice["outstanding_amount"])
+            if reference:
+                recorded[reference] = payment_entry.name
+            results[idx] = capture_result(idx, capture, "Success", payment_entry=payment_entry.name, invoice=invoice["name"])
+
+        frappe.db.commit()
+
+    return {
+        "status": "Success" if all(result["status"] != "Failure" for result in results) else "Failure",
+        "results": results,
+    }
+
+
+def make_payment_entry(invoice_name, mode_of_payment, reference_no=None, amount=None):
+    # 🧾 Create Payment Entry from the Sales Invoice, for the outstanding amount unless given
+    payment_entry = get_payment_entry("Sales Invoice", invoice_name, party_amount=amount)
+
+    # 🪙 Set missing fields
+    payment_entry.mode_of_payment = mode_of_payment
+    payment_entry.reference_no = reference_no or invoice_name
+    payment_entry.reference_date = nowdate()
+
+    # Allow creation even if user lacks permission (for API usage)
+    payment_entry.ignore_permissions = True
+
+    # 💾 Save and submit
+    payment_entry.insert()
+    payment_entry.submit()
+    return payment_entry
+
+
+def get_order_invoices(order_ids):
+    # {casefolded order id: {"sales_order": name, "invoices": [{"name", "outstanding_amount"}]}}
+    if not order_ids:
+        return {}
+
+    rows = frappe.db.sql("""
+        SELECT DISTINCT so.po_no, so.name AS sales_order, si.name AS invoice, si.outstanding_amount
+        FROM `tabSales Order` so
+        LEFT JOIN `tabSales Invoice Item` sii ON sii.sales_order = so.name
+        LEFT JOIN `tabSales Invoice` si ON si.name = sii.parent AND si.docstatus = 1
+        WHERE so.po_no IN %(order_ids)s AND so.docstatus < 2
+        ORDER BY so.creation ASC, si.creation ASC
+    """, {"order_ids": tuple({cstr(order_id) for order_id in order_ids})}, as_dict=True)
+
+    orders = {}
+    for row in rows:
+        order = orders.setdefault(row.po_no.casefold(), {"sales_order": row.sales_order, "invoices": []})
+        if row.invoice and row.sales_order == order["sales_order"]:
+            order["invoices"].append({"name": row.invoice, "outstanding_amount": flt(row.outstanding_amount)})
+    return orders
+
+
+def get_recorded_references(references):
+    # {reference_no: payment entry} for references already used by a submitted Payment Entry
+    references = {cstr(reference) for reference in references if reference}
+    if not references:
+        return {}
+
+    return dict(frappe.db.sql("""
+        SELECT reference_no, name
+        FROM `tabPayment Entry`
+        WHERE
+            docstatus = 1
+            AND reference_no IN %(references)s
+    """, {"references": tuple(references)}))
+
+
+def capture_result(idx, capture, status, payment_entry=None, invoice=None, message=None):
+    result = {
+        "index": idx,
+        "order_id": capture.get("order_id") if isinstance(capture, dict) else None,
+        "status": status,
+    }
+    if payment_entry:
+        result["payment_entry"] = payment_entry
+    if invoice:
+        result["invoice"] = invoice
+    if message:
+        result["message"] = message
+    return result
@@ -0,0 +1,130 @@
+import frappe
+from frappe.utils import cstr, get_datetime, getdate
+
+from iban_ecommerce.doctype_triggers.hr.employee_checkin.employee_checkin import recompute_log_type
+from iban_ecommerce.tasks.checkin_log_type import process_dirty_checkin_days
+from iban_ecommerce.utils.checkin_log_type import lock_checkin_day, mark_days_dirty, use_deferred_log_type
+from iban_ecommerce.utils.metrics import instrument
+
+
+@frappe.whitelist()
+@instrument("create_employee_checkins_bulk")
+def create_employee_checkins_bulk():
+    # 📥 Accept either {"checkins": [...]} or a bare list of punches
+    data = frappe.request.get_json()
+    checkins = data.get("checkins") if isinstance(data, dict) else data
+    if not checkins or not isinstance(checkins, list):
+        frappe.throw("Checkins list is required and must contain at least one checkin")
+
+    results = [None] * len(checkins)
+    pending = {}
+
+    # ✅ Validate and drop punches repeated inside the batch
+    for idx, checkin in enumerate(checkins):
+        if not isinstance(checkin, dict) or not checkin.get("employee") or not checkin.get("time"):
+            results[idx] = checkin_result(idx, "error", message="Each checkin needs an employee and a time")
+            continue
+        try:
+            time = get_datetime(checkin["time"])
+        except Exception:
+            results[idx] = checkin_result(idx, "error", message=f"Invalid time: {checkin['time']}")
+            continue
+
+        key = (checkin["employee"], time, cstr(checkin.get("device_id")))
+        if key in pending:
+            results[idx] = checkin_result(idx, "duplicate")
+        else:
+            pending[key] = idx
+
+    # 🔎 Punches already stored by an earlier sync are reported, not inserted again
+    existing = get_existing_checkins(pending)
+    affected_days = set()
+
+    # 🔒 Lock every employee-day up front, in a fixed order so two bulk calls cannot deadlock
+    deferred = use_deferred_log_type()
+    if not deferred:
+        for employee, day in sorted({(employee, getdate(time)) for (employee, time, _) in pending}):
+            lock_checkin_day(employee, day)
+
+    for key, idx in pending.items():
+        employee, time, device_id = key
+        if key in existing:
+            results[idx] = checkin_result(idx, "duplicate", name=existing[key])
+            continue
+
+        frappe.db.savepoint("bulk_employee_checkin")
+        try:
+            doc = frappe.get_doc({
+                "doctype": "Employee Checkin",
+                "employee": employee,
+                "time": time,
+                "device_id": device_id or None,
+            })
+            # IN / OUT is recomputed once per employee-day below
+            doc.flags.skip_log_type_update = True
+            doc.insert(ignore_permissions=True)
+            affected_days.add((employee, getdate(time)))
+            results[idx] = checkin_result(idx, "created", name=doc.name)
+        except Exception as e:
+            frappe.db.rollback(save_point="bulk_employee_checkin")
+            frappe.clear_messages()
+            results[idx] = checkin_result(idx, "error", message=str(e))
+
+    # 🔁 Update log Type (IN - Out) once for every employee-day that got new punches,
+    # in the background when the site runs the deferred mode
+    if deferred:
+        mark_days_dirty(affected_days)
+    else:
+        for employee, day in sorted(affected_days):
+            recompute_log_type(employee, day)
+
+    frappe.db.commit()
+
+    return {
+        "status": "success",
+        "created": sum(1 for result in results if result["status"] == "created"),
+        "duplicates": sum(1 for result in results if result["status"] == "duplicate"),
+        "failed": sum(1 for result in results if result["status"] == "error"),
+        "results": results,
+    }
+
+
+@frappe.whitelist()
+@instrument("flush_checkin_log_types")
+def flush_checkin_log_types():
+    # 🔁 Recompute every pending employee-day now, for reports that need fresh IN / OUT
+    return {
+        "status": "success",
+        "recomputed": process_dirty_checkin_days(),
+    }
+
+
+def get_existing_checkins(keys):
+    # {(employee, time, device_id): name} for punches already in the database
+    if not keys:
+        return {}
+
+    times = [time for _, time, _ in keys]
+    rows = frappe.db.sql("""
+        SELECT name, employee, time, device_id
+        FROM `tabEmployee Checkin`
+        WHERE
+            employee IN %(employees)s
+            AND time >= %(start)s
+            AND time <= %(end)s
+    """, {
+        "employees": tuple({employee for employee, _, _ in keys}),
+        "start": min(times),
+        "end": max(times),
+    }, as_dict=True)
+
+    return {(row.employee, get_datetime(row.time), cstr(row.device_id)): row.name for row in rows}
+
+
+def checkin_result(idx, status, name=None, message=None):
+    result = {"index": idx, "status": status}
+    if name:
+        result["name"] = name
+    if message:
+        result["message"] = message
+    return result
@@ -0,0 +1,11 @@
+import frappe
+from werkzeug.wrappers import Response
+
+from iban_ecommerce.utils.metrics import render_prometheus
+
+
+@frappe.whitelist()
+def get_metrics():
+    # 📈 Latency, query and commit histograms of the ecommerce APIs in Prometheus text format
+    frappe.only_for("System Manager")
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4; charset=utf-8")
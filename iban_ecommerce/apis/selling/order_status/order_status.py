@@ -0,0 +1,228 @@
+import base64
+import heapq
+import json
+
+import frappe
+from frappe.utils import cint, cstr, flt
+
+from iban_ecommerce.apis.selling.sales_order.sales_order import get_linked_payments
+from iban_ecommerce.utils.metrics import instrument, phase
+
+# 📜 Changes returned per page of get_order_changes
+DEFAULT_FEED_LIMIT = 500
+MAX_FEED_LIMIT = 5000
+
+# 🔢 External ids accepted per get_orders_status call
+MAX_STATUS_ORDER_IDS = 5000
+
+FEED_DOCTYPES = ("Sales Order", "Sales Invoice", "Payment Entry")
+
+
+@frappe.whitelist()
+@instrument("get_order_changes")
+def get_order_changes(cursor=None, limit=DEFAULT_FEED_LIMIT):
+    # 📜 Sales Order, Sales Invoice and Payment Entry changes of ecommerce orders after
+    # the cursor, oldest first. Pass the returned cursor to get the next page.
+    limit = min(max(cint(limit) or DEFAULT_FEED_LIMIT, 1), MAX_FEED_LIMIT)
+    try:
+        after = decode_cursor(cursor)
+    except Exception:
+        return {"status": "error", "message": "Invalid cursor"}
+
+    # 🔎 One keyset range scan per doctype, each with its own (modified, name) position.
+    # Names are ordered by the database collation, so the scans are merged on modified
+    # only and every doctype keeps the order its query returned.
+    with phase("scan"):
+        scans = [get_changed_documents(doctype, after.get(doctype), limit + 1) for doctype in FEED_DOCTYPES]
+        changes = list(heapq.merge(*scans, key=lambda change: change.modified))
+
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    for change in changes:
+        after[change.doctype] = (str(change.modified), change.name)
+
+    with phase("resolution"):
+        sales_orders = get_changed_sales_orders(changes)
+        records = get_order_status_records({so for names in sales_orders.values() for so in names})
+
+    # 📤 One entry per changed document and ecommerce order it belongs to
+    entries = []
+    for change in changes:
+        for sales_order in sales_orders.get((change.doctype, change.name), ()):
+            if sales_order in records:
+                entries.append({
+                    "doctype": change.doctype,
+                    "name": change.name,
+                    "modified": str(change.modified),
+                    **records[sales_order],
+                })
+
+    return {
+        "status": "success",
+        "changes": entries,
+        "cursor": encode_cursor(after) if changes else cursor,
+        "has_more": has_more,
+    }
+
+
+@frappe.whitelist()
+@instrument("get_orders_status")
+def get_orders_status(order_ids=None):
+    # 📦 Status of many orders by external id (po_no) with four set-based queries
+    # 📥 A JSON list in the body or a JSON encoded string in the query
+    order_ids = frappe.parse_json(order_ids) if isinstance(order_ids, str) else order_ids
+
+    if not order_ids or not isinstance(order_ids, list):
+        return {"status": "error", "message": "order_ids must be a non-empty list"}
+    if len(order_ids) > MAX_STATUS_ORDER_IDS:
+        return {"status": "error", "message": f"At most {MAX_STATUS_ORDER_IDS} order_ids per call"}
+
+    with phase("resolution"):
+        records = get_order_status_records({cstr(order_id) for order_id in order_ids if order_id}, field="po_no")
+
+    # ♻️ A po_no reused after a cancellation reports its live order
+    by_po_no = {}
+    for record in records.values():
+        current = by_po_no.get(record["po_no"].casefold())
+        if not current or (current["docstatus"] == 2 and record["docstatus"] < 2):
+            by_po_no[record["po_no"].casefold()] = record
+
+    orders = []
+    for order_id in order_ids:
+        record = by_po_no.get(cstr(order_id).casefold())
+        if record:
+            orders.append({"order_id": order_id, "found": True, **record})
+        else:
+            orders.append({"order_id": order_id, "found": False})
+
+    return {"status": "success", "orders": orders}
+
+
+def encode_cursor(after):
+    position = json.dumps({doctype: list(values) for doctype, values in after.items()})
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor):
+    # {doctype: (modified, name)} of the last change already seen per doctype, empty
+    # to start from the beginning. A single (modified, name) of older cursors applies to all.
+    if not cursor:
+        return {}
+    position = json.loads(base64.urlsafe_b64decode(cstr(cursor).encode()))
+    if isinstance(position, list):
+        position = dict.fromkeys(FEED_DOCTYPES, position)
+    return {
+        doctype: (cstr(position[doctype][0]), cstr(position[doctype][1]))
+        for doctype in FEED_DOCTYPES
+        if doctype in position
+    }
+
+
+def get_changed_documents(doctype, after, limit):
+    # 🔎 Range scan on the modified index, which InnoDB stores together with the
+    # primary key, so (modified, name) needs no extra index and no OFFSET
+    conditions = []
+    if after:
+        conditions.append("modified >= %(modified)s AND (modified > %(modified)s OR name > %(name)s)")
+    if doctype == "Sales Order":
+        conditions.append("COALESCE(po_no, '') != ''")
+    elif doctype == "Payment Entry":
+        conditions.append("payment_type = 'Receive'")
+
+    rows = frappe.db.sql(f"""
+        SELECT name, modified
+        FROM `tab{doctype}`
+        {"WHERE " + " AND ".join(conditions) if conditions else ""}
+        ORDER BY modified ASC, name ASC
+        LIMIT {cint(limit)}
+    """, {"modified": after and after[0], "name": after and after[1]}, as_dict=True)
+
+    for row in rows:
+        row.doctype = doctype
+    return rows
+
+
+def get_changed_sales_orders(changes):
+    # {(doctype, name): [sales order, ...]} for a page of changes, two queries at most
+    sales_orders = {}
+    names = {doctype: [c.name for c in changes if c.doctype == doctype] for doctype in FEED_DOCTYPES}
+
+    for name in names["Sales Order"]:
+        sales_orders[("Sales Order", name)] = [name]
+
+    if names["Sales Invoice"]:
+        for invoice, sales_order in frappe.db.sql("""
+            SELECT DISTINCT parent, sales_order
+            FROM `tabSales Invoice Item`
+            WHERE parent IN %(invoices)s AND COALESCE(sales_order, '') != ''
+        """, {"invoices": tuple(names["Sales Invoice"])}):
+            sales_orders.setdefault(("Sales Invoice", invoice), []).append(sales_order)
+
+    if names["Payment Entry"]:
+        # Payments reference the invoice, or the order itself for advances
+        for payment, sales_order in frappe.db.sql("""
+            SELECT DISTINCT
+                per.parent,
+                CASE WHEN per.reference_doctype = 'Sales Order' THEN per.reference_name ELSE sii.sales_order END
+            FROM `tabPayment Entry Reference` per
+            LEFT JOIN `tabSales Invoice Item` sii
+                ON per.reference_doctype = 'Sales Invoice' AND sii.parent = per.reference_name
+            WHERE per.parent IN %(payments)s
+        """, {"payments": tuple(names["Payment Entry"])}):
+            if sales_order:
+                sales_orders.setdefault(("Payment Entry", payment), []).append(sales_order)
+
+    return sales_orders
+
+
+def get_order_status_records(values, field="name"):
+    # {sales order: compact status record} for ecommerce orders (those with a po_no)
+    # whose name, or po_no with field="po_no", is in values. Three set-based queries
+    # whatever the number of orders.
+    if not values:
+        return {}
+
+    orders = frappe.db.sql(f"""
+        SELECT name, po_no, docstatus, status, grand_total
+        FROM `tabSales Order`
+        WHERE `{field}` IN %(values)s AND COALESCE(po_no, '') != ''
+        ORDER BY creation ASC
+    """, {"values": tuple(values)}, as_dict=True)
+    if not orders:
+        return {}
+
+    invoices = frappe.db.sql("""
+        SELECT DISTINCT sii.sales_order, si.name, si.docstatus, si.outstanding_amount, si.creation
+        FROM `tabSales Invoice Item` sii
+        JOIN `tabSales Invoice` si ON si.name = sii.parent
+        WHERE sii.sales_order IN %(sales_orders)s AND si.docstatus < 2
+        ORDER BY si.creation ASC
+    """, {"sales_orders": tuple(order.name for order in orders)}, as_dict=True)
+    payments = get_linked_payments({invoice.name for invoice in invoices})
+
+    records = {}
+    for order in orders:
+        records[order.name] = {
+            "po_no": order.po_no,
+            "sales_order": order.name,
+            "docstatus": order.docstatus,
+            "status": order.status,
+            "grand_total": flt(order.grand_total),
+            # Nothing is owed on a cancelled order, an uninvoiced one owes its total
+            "outstanding_amount": 0 if order.docstatus == 2 else flt(order.grand_total),
+            "invoices": [],
+            "payments": [],
+        }
+
+    invoiced = set()
+    for invoice in invoices:
+        record = records[invoice.sales_order]
+        record["invoices"].append(invoice.name)
+        record["payments"] += [p for p in payments.get(invoice.name, []) if p not in record["payments"]]
+        if invoice.docstatus == 1:
+            if invoice.sales_order not in invoiced:
+                invoiced.add(invoice.sales_order)
+                record["outstanding_amount"] = 0
+            record["outstanding_amount"] += flt(invoice.outstanding_amount)
+
+    return records
@@ -1,31 +1,606 @@
-import requests
 import frappe
-from frappe.custom.doctype.custom_field.custom_field import create_custom_field
+from frappe.utils import cint, cstr, flt, now_datetime
 from iban_ecommerce.doctype_triggers.selling.sales_order.sales_order import create_sales_invoice
-
-# 🌍 Base URL of your ERPNext/Frappe site
-BASE_URL = "http://localhost:8000"
-API_KEY = ""
-API_SECRET = ""
+from iban_ecommerce.install import CUSTOM_FIELDS, make_custom_fields
+from iban_ecommerce.utils.locks import (
+    acquire_lock,
+    get_lock_name,
+    hold_until_transaction_end,
+    release_lock,
+)
+from iban_ecommerce.utils.master_data import (
+    DEFAULT_ITEM_GROUP,
+    create_customer,
+    create_item,
+    create_item_group,
+    create_warehouse,
+    get_or_create_items,
+    get_or_create_name,
+    get_or_create_names,
+    resolve_name,
+    resolve_names,
+)
+from iban_ecommerce.utils.metrics import instrument, phase
+from iban_ecommerce.utils.schema import compile_schema
+
+# 🧵 Dedicated RQ queue for submit + invoice jobs, used when a worker is configured for it
+ORDER_QUEUE = "iban_ecommerce"
+ORDER_JOB_STATUS_TTL = 7 * 24 * 60 * 60
+
+# 🔒 Sites whose custom fields were already checked by this process
+_checked_sites = set()
+
+# 📦 Orders inserted per transaction by create_sales_orders_bulk (0 = one transaction)
+DEFAULT_BULK_CHUNK_SIZE = 100
+
+# 📤 Fields returned by the order APIs unless "fields" or "full_response" ask otherwise
+COMPACT_ORDER_FIELDS = (
+    "name",
+    "po_no",
+    "status",
+    "docstatus",
+    "customer",
+    "transaction_date",
+    "currency",
+    "net_total",
+    "total_taxes_and_charges",
+    "grand_total",
+    "rounded_total",
+    "taxes",
+)
+
+# ✅ Payload schemas, compiled once at import
+ORDER_SCHEMA = compile_schema({
+    "customer": {"type": "code", "required": True},
+    "set_warehouse": {"type": "code", "required": True},
+    "po_no": {"type": "code"},
+    "idempotency_key": {"type": "string"},
+    "transaction_date": {"type": "date"},
+    "delivery_date": {"type": "date"},
+    "custom_mode_of_payment": {"type": "string"},
+    "is_submittable": {"type": "flag"},
+    "is_async": {"type": "flag"},
+    "items": {
+        "type": "list",
+        "required": True,
+        "min_items": 1,
+        "items": {
+            "type": "object",
+            "fields": {
+                "item_code": {"type": "code", "required": True},
+                "qty": {"type": "number", "required": True, "gt": 0},
+                "rate": {"type": "number", "required": True, "gt": 0},
+                "item_group": {"type": "string"},
+            },
+        },
+    },
+})
+BULK_ORDERS_SCHEMA = compile_schema({
+    "orders": {"type": "list", "required": True, "min_items": 1},
+    "chunk_size": {"type": "integer"},
+    "is_async": {"type": "flag"},
+})
+
+# ♻️ Seconds a committed order stays published to attempts waiting on its lock
+PUBLISHED_ORDER_TTL = 5 * 60
 
 @frappe.whitelist()
+@instrument("create_sales_order")
 def create_sales_order():
+    # 📥 Get JSON body from API request
+    data = frappe.request.get_json()
+    response_options = pop_response_options(data)
+
+    with phase("validation"):
+        # ✅ Validate the whole payload before any database access
+        error = validate_order(data)
+        if error:
+            frappe.throw(error)
+
+        # 🔒 Ensure custom field exists before proceeding
+        ensure_missing_fields()
+
+        # ♻️ A retried request gets the order created by the first attempt back,
+        # concurrent attempts wait on the order lock until the first one commits
+        idempotency_key = data.get("idempotency_key") or frappe.request.headers.get("Idempotency-Key")
+        order_lock, existing_order = lock_order(idempotency_key, data.get("po_no"))
+        existing_order = existing_order or find_existing_orders([(idempotency_key, data.get("po_no"))])[0]
+        if existing_order:
+            release_order_lock(order_lock)
+            return project_sales_order(frappe.get_doc("Sales Order", existing_order), response_options)
+        if idempotency_key:
+            data["custom_idempotency_key"] = idempotency_key
+
+    # 🔎 Validate or create related documents
+    with phase("resolution"):
+        data["items"] = validate_items(data["items"])
+
+    # 📄 Create Sales Order document
+    with phase("taxes"):
+        so_doc = build_sales_order(data)
+
+    with phase("insert"):
+        so_doc.insert(ignore_permissions=True)
+
+    # 🚀 Optionally submit if flag provided, in the background when is_async is on
+    is_submittable = data.get('is_submittable')
+    is_async = is_submittable and use_async_submit(data)
+    with phase("submit"):
+        if is_async:
+            enqueue_submit_and_invoice(so_doc.name)
+        elif is_submittable:
+            so_doc.submit()
+
+    # 🧾 The invoice runs under its own savepoint, a failure there keeps the order
+    if is_submittable and not is_async:
+        create_sales_invoice(so_doc)
+
+    publish_order(order_lock, so_doc.name)
+
+    # 💾 One commit for the whole order, any error above rolls everything back
+    frappe.db.commit()
+
+    # 📤 Return the inserted Sales Order, compact unless asked otherwise
+    return project_sales_order(so_doc, response_options)
+
+
+@frappe.whitelist()
+@instrument("create_sales_orders_bulk")
+def create_sales_orders_bulk():
+    # 📥 Accept either {"orders": [...], "chunk_size": n} or a bare list of orders
+    data = frappe.request.get_json()
+    if isinstance(data, list):
+        data = {"orders": data}
+    errors = BULK_ORDERS_SCHEMA(data)
+    if errors:
+        frappe.throw("; ".join(errors))
+
     # 🔒 Ensure custom field exists before proceeding
     ensure_missing_fields()
 
-    # 📥 Get JSON body from API request
+    orders = data["orders"]
+    chunk_size = DEFAULT_BULK_CHUNK_SIZE
+    if data.get("chunk_size") is not None:
+        chunk_size = cint(data.get("chunk_size"))
+    if chunk_size <= 0:
+        chunk_size = len(orders)
+    is_async = use_async_submit(data)
+
+    results = [None] * len(orders)
+    pending = []
+
+    with phase("validation"):
+        # ✅ Validate every order up front, invalid ones are reported and skipped
+        for idx, order in enumerate(orders):
+            error = validate_order(order)
+            if error:
+                results[idx] = bulk_result(idx, order, error=error)
+            else:
+                pending.append((idx, order))
+
+        # ♻️ Copies of an order inside this payload (same idempotency key or po_no) are
+        # not created twice, they get the result of the first copy once it is known
+        first_copies = {}
+        repeated_orders = []
+        unique_orders = []
+        for idx, order in pending:
+            keys = [
+                (field, cstr(order.get(field)).casefold())
+                for field in ("idempotency_key", "po_no")
+                if order.get(field)
+            ]
+            first = next((first_copies[key] for key in keys if key in first_copies), None)
+            if first is not None:
+                repeated_orders.append((idx, order, first))
+                continue
+            for key in keys:
+                first_copies[key] = idx
+            unique_orders.append((idx, order))
+        pending = unique_orders
+
+        # ♻️ Orders already created by an earlier attempt are returned as they are
+        existing_orders = find_existing_orders([(o.get("idempotency_key"), o.get("po_no")) for _, o in pending])
+        new_orders = []
+        for (idx, order), existing_order in zip(pending, existing_orders, strict=True):
+            if existing_order:
+                results[idx] = bulk_result(idx, order, sales_order=existing_order, duplicate=True)
+            else:
+                if order.get("idempotency_key"):
+                    order["custom_idempotency_key"] = order["idempotency_key"]
+                new_orders.append((idx, order))
+        pending = new_orders
+
+    # 🔎 Resolve all distinct masters with a handful of set-based queries
+    with phase("resolution"):
+        customers, customer_errors = get_or_create_names("Customer", {o["customer"] for _, o in pending})
+        warehouses, warehouse_errors = get_or_create_names("Warehouse", {o["set_warehouse"] for _, o in pending})
+        items, item_errors = get_or_create_items([row for _, o in pending for row in o["items"]])
+
+    for chunk_start in range(0, len(pending), chunk_size):
+        for idx, order in pending[chunk_start:chunk_start + chunk_size]:
+            error = (
+                customer_errors.get(cstr(order["customer"]))
+                or warehouse_errors.get(cstr(order["set_warehouse"]))
+                or next((item_errors[cstr(row["item_code"])] for row in order["items"] if cstr(row["item_code"]) in item_errors), None)
+            )
+            if error:
+                results[idx] = bulk_result(idx, order, error=error)
+                continue
+
+            order["customer"] = customers[cstr(order["customer"])]
+            order["set_warehouse"] = warehouses[cstr(order["set_warehouse"])]
+            for row in order["items"]:
+                row["item_code"] = items[cstr(row["item_code"])]
+                row['price_list_rate'] = row.get('rate', 0) or 0
+
+            # 💾 Each order gets its own savepoint so one bad order does not sink the chunk
+            frappe.db.savepoint("bulk_sales_order")
+            order_lock = None
+            try:
+                # ♻️ A concurrent request may have created the same order since the check above
+                order_lock, existing_order = lock_order(order.get("idempotency_key"), order.get("po_no"))
+                if existing_order:
+                    release_order_lock(order_lock)
+                    results[idx] = bulk_result(idx, order, sales_order=existing_order, duplicate=True)
+                    continue
+
+                with phase("taxes"):
+                    so_doc = build_sales_order(order)
+                with phase("insert"):
+                    so_doc.insert(ignore_permissions=True)
+                with phase("submit"):
+                    if order.get('is_submittable') and is_async:
+                        enqueue_submit_and_invoice(so_doc.name)
+                    elif order.get('is_submittable'):
+                        so_doc.submit()
+                if order.get('is_submittable') and not is_async:
+                    create_sales_invoice(so_doc)
+                publish_order(order_lock, so_doc.name)
+                results[idx] = bulk_result(idx, order, sales_order=so_doc.name)
+            except Exception as e:
+                frappe.db.rollback(save_point="bulk_sales_order")
+                frappe.clear_messages()
+                release_order_lock(order_lock)
+                results[idx] = bulk_result(idx, order, error=str(e))
+
+        frappe.db.commit()
+
+    for idx, order, first in repeated_orders:
+        results[idx] = bulk_result(
+            idx,
+            order,
+            sales_order=results[first].get("sales_order"),
+            error=results[first].get("message"),
+            duplicate=True,
+            duplicate_of=first,
+        )
+
+    failed = sum(1 for result in results if result["status"] == "error")
+    return {
+        "status": "success" if not failed else "partial" if failed < len(results) else "error",
+        "created": len(results) - failed,
+        "failed": failed,
+        "results": results,
+    }
+
+
+@frappe.whitelist()
+@instrument("quote_sales_order")
+def quote_sales_order():
+    # 🧮 Totals and taxes of a cart through the same pipeline as create_sales_order,
+    # in memory only: nothing is inserted and no master is created
     data = frappe.request.get_json()
 
-    # ✅ Validate required fields
-    validate_required_fields(data, ["customer", "set_warehouse", "items"])
-    if not data.get("items") or not isinstance(data["items"], list):
-        frappe.throw("Items list is required and must contain at least one item")
-    for item in data["items"]:
-        validate_required_fields(item, ["item_code", "qty", "rate"])
+    with phase("validation"):
+        error = validate_order(data)
+        if error:
+            return {"status": "error", "message": error}
+
+    # 🔎 Existing masters only, from the resolution cache
+    with phase("resolution"):
+        items = resolve_names("Item", [row["item_code"] for row in data["items"]])
+        unknown_items = [row["item_code"] for row in data["items"] if cstr(row["item_code"]) not in items]
+        if unknown_items:
+            return {
+                "status": "error",
+                "message": f"Unknown items: {', '.join(map(cstr, unknown_items))}",
+                "unknown_items": unknown_items,
+            }
+
+        # 👤 A new customer or warehouse does not change the taxes, quote without it
+        data["customer"] = resolve_name("Customer", data["customer"])
+        data["set_warehouse"] = resolve_name("Warehouse", data["set_warehouse"])
+        for row in data["items"]:
+            row["item_code"] = items[cstr(row["item_code"])]
+            row["price_list_rate"] = row.get("rate", 0) or 0
 
-    # 🔎 Validate or create related documents
-    data["items"] = validate_items(data["items"])
+    with phase("taxes"):
+        # 🛡️ Anything the pipeline might write is undone, the request commits nothing
+        frappe.db.savepoint("quote_sales_order")
+        try:
+            so_doc = build_sales_order(data)
+        finally:
+            frappe.db.rollback(save_point="quote_sales_order")
+
+    return {
+        "status": "success",
+        "currency": so_doc.currency,
+        "net_total": flt(so_doc.net_total),
+        "total_taxes_and_charges": flt(so_doc.total_taxes_and_charges),
+        "grand_total": flt(so_doc.grand_total),
+        "rounded_total": flt(so_doc.rounded_total),
+        "taxes": compact_taxes(so_doc),
+        "items": compact_items(so_doc),
+    }
+
+
+def pop_response_options(data):
+    # 📤 "fields" (list or comma separated) and "full_response" shape the answer,
+    # they are not Sales Order fields
+    if not isinstance(data, dict):
+        return {}
+    return {"fields": data.pop("fields", None), "full_response": data.pop("full_response", None)}
+
+
+def project_sales_order(so_doc, options=None):
+    # 📤 Compact profile by default, the requested fields, or the full as_dict()
+    options = options or {}
+    if cint(options.get("full_response")):
+        return so_doc.as_dict()
+
+    fields = options.get("fields") or COMPACT_ORDER_FIELDS
+    if isinstance(fields, str):
+        fields = [field.strip() for field in fields.split(",") if field.strip()]
+
+    response = {}
+    for field in fields:
+        if field == "taxes":
+            response[field] = compact_taxes(so_doc)
+        elif field == "items":
+            response[field] = compact_items(so_doc)
+        else:
+            value = so_doc.get(field)
+            response[field] = [row.as_dict() for row in value] if isinstance(value, list) else value
+    return response
+
+
+def compact_taxes(so_doc):
+    return [
+        {
+            "account_head": tax.account_head,
+            "description": tax.description,
+            "rate": flt(tax.rate),
+            "tax_amount": flt(tax.tax_amount),
+        }
+        for tax in so_doc.taxes
+    ]
+
+
+def compact_items(so_doc):
+    return [
+        {
+            "item_code": row.item_code,
+            "qty": flt(row.qty),
+            "rate": flt(row.rate),
+            "amount": flt(row.amount),
+            "item_tax_template": row.item_tax_template,
+        }
+        for row in so_doc.items
+    ]
+
+
+def use_async_submit(data):
+    # 🧵 Per request "is_async" flag, defaulting to the site config (off unless enabled)
+    is_async = data.get("is_async")
+    if is_async is None:
+        is_async = frappe.conf.get("iban_ecommerce_async_submit", 0)
+    return cint(is_async)
+
+
+def get_order_queue():
+    return ORDER_QUEUE if ORDER_QUEUE in (frappe.conf.get("workers") or {}) else "long"
+
+
+def enqueue_submit_and_invoice(sales_order):
+    # 🧵 One job per Sales Order, re-queueing an order that is already waiting is a no-op
+    if (get_order_job_status_record(sales_order) or {}).get("status") not in ("submitting", "invoicing"):
+        set_order_job_status(sales_order, "queued")
+
+    frappe.enqueue(
+        "iban_ecommerce.apis.selling.sales_order.sales_order.submit_and_invoice",
+        queue=get_order_queue(),
+        job_id=f"iban_ecommerce::submit_and_invoice::{sales_order}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        sales_order=sales_order,
+    )
+
+
+@instrument("submit_and_invoice")
+def submit_and_invoice(sales_order):
+    try:
+        set_order_job_status(sales_order, "submitting")
+        so_doc = frappe.get_doc("Sales Order", sales_order)
+        if so_doc.docstatus == 0:
+            with phase("submit"):
+                so_doc.submit()
+
+        # 🧾 A retried job must not invoice the same order twice
+        invoice = get_sales_order_invoice(sales_order)
+        if not invoice and so_doc.docstatus == 1:
+            set_order_job_status(sales_order, "invoicing")
+            invoice = create_sales_invoice(so_doc)
+            invoice = invoice and invoice.name
+
+        # 💾 The submit is kept even when invoicing failed, the invoice sweep retries it
+        frappe.db.commit()
+
+        if not invoice:
+            set_order_job_status(sales_order, "failed", error="Sales Invoice could not be created, check the Error Log")
+            return
+
+        set_order_job_status(sales_order, "completed", sales_invoice=invoice)
+
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.log_error(message=frappe.get_traceback(), title="submit_and_invoice failed")
+        set_order_job_status(sales_order, "failed", error=str(e))
+
+
+def get_sales_order_invoice(sales_order):
+    return frappe.db.get_value(
+        "Sales Invoice Item", {"sales_order": sales_order, "docstatus": ["<", 2]}, "parent"
+    )
+
+
+def order_job_key(sales_order):
+    return f"iban_ecommerce:order_job:{sales_order}"
+
+
+def get_order_job_status_record(sales_order):
+    return frappe.cache().get_value(order_job_key(sales_order))
 
+
+def set_order_job_status(sales_order, status, **details):
+    frappe.cache().set_value(
+        order_job_key(sales_order),
+        {"status": status, "updated_at": str(now_datetime()), **details},
+        expires_in_sec=ORDER_JOB_STATUS_TTL,
+    )
+
+
+@frappe.whitelist()
+@instrument("get_order_job_status")
+def get_order_job_status(order_id):
+    sales_order = get_order_by_po_no(order_id)
+    if not sales_order:
+        return {
+            "status": "error",
+            "message": f"No Sales Order found with PO No: {order_id}"
+        }
+
+    job = get_order_job_status_record(sales_order.name) or {}
+    invoice = job.get("sales_invoice") or get_sales_order_invoice(sales_order.name)
+
+    # 🕓 Orders that never went through the queue report their document state
+    job_status = job.get("status")
+    if not job_status:
+        job_status = "completed" if invoice else "not_queued"
+
+    return {
+        "status": "success",
+        "sales_order": sales_order.name,
+        "docstatus": sales_order.docstatus,
+        "job_status": job_status,
+        "sales_invoice": invoice,
+        "error": job.get("error"),
+        "updated_at": job.get("updated_at"),
+    }
+
+
+def get_order_by_po_no(order_id):
+    # 🔎 The live order of a po_no (reusable after a cancel), else its latest cancelled one
+    orders = frappe.get_all(
+        "Sales Order",
+        filters={"po_no": order_id},
+        fields=["name", "docstatus"],
+        order_by="creation desc",
+    )
+    return next((order for order in orders if order.docstatus < 2), orders[0] if orders else None)
+
+
+def find_existing_orders(lookups):
+    # ♻️ For each (idempotency_key, po_no) pair, the Sales Order an earlier request
+    # created for it or None. An explicit key matches any order carrying it, a po_no
+    # only matches orders that were not cancelled.
+    keys = {cstr(key).casefold() for key, _ in lookups if key}
+    po_nos = {cstr(po_no).casefold() for _, po_no in lookups if po_no}
+    if not keys and not po_nos:
+        return [None] * len(lookups)
+
+    conditions = []
+    if keys:
+        conditions.append("custom_idempotency_key IN %(keys)s")
+    if po_nos:
+        conditions.append("(po_no IN %(po_nos)s AND docstatus < 2)")
+
+    rows = frappe.db.sql(f"""
+        SELECT name, po_no, custom_idempotency_key, docstatus
+        FROM `tabSales Order`
+        WHERE {" OR ".join(conditions)}
+        ORDER BY creation ASC
+    """, {"keys": tuple(keys), "po_nos": tuple(po_nos)}, as_dict=True)
+
+    by_key = {}
+    by_po_no = {}
+    for row in rows:
+        if row.custom_idempotency_key:
+            by_key.setdefault(row.custom_idempotency_key.casefold(), row.name)
+        # Rows found through their idempotency key may be cancelled, which frees their po_no
+        if row.po_no and row.po_no.casefold() in po_nos and row.docstatus < 2:
+            by_po_no.setdefault(row.po_no.casefold(), row.name)
+
+    return [
+        (key and by_key.get(cstr(key).casefold())) or (po_no and by_po_no.get(cstr(po_no).casefold())) or None
+        for key, po_no in lookups
+    ]
+
+
+def lock_order(idempotency_key, po_no):
+    # 🔒 Attempts of the same order run one at a time. Returns the lock and the order
+    # published by the previous holder, whose commit our snapshot may not see yet.
+    key = cstr(po_no or idempotency_key).casefold()
+    if not key:
+        return None, None
+
+    order_lock = frappe._dict(name=get_lock_name("Sales Order", key), key=key)
+    acquire_lock(order_lock.name)
+    frappe.db.after_rollback.add(lambda: release_lock(order_lock.name))
+
+    # A po_no is free again once its order is cancelled, read with a locking read so
+    # a cancel committed after our snapshot is seen
+    published = frappe.cache().get_value(published_order_key(key))
+    if published and po_no and frappe.db.get_value("Sales Order", published, "docstatus", for_update=True) in (None, 2):
+        published = None
+    return order_lock, published
+
+
+def release_order_lock(order_lock):
+    if order_lock:
+        release_lock(order_lock.name)
+
+
+def publish_order(order_lock, sales_order):
+    # 📣 Keep the lock until commit, then hand the order to the attempts waiting for it
+    if not order_lock:
+        return
+    hold_until_transaction_end(order_lock.name, on_commit=lambda: frappe.cache().set_value(
+        published_order_key(order_lock.key), sales_order, expires_in_sec=PUBLISHED_ORDER_TTL
+    ))
+
+
+def published_order_key(key):
+    return f"iban_ecommerce:published_order:{key}"
+
+
+def bulk_result(idx, order, sales_order=None, error=None, duplicate=False, duplicate_of=None):
+    result = {
+        "index": idx,
+        "po_no": order.get("po_no") if isinstance(order, dict) else None,
+        "status": "error" if error else "success",
+    }
+    if error:
+        result["message"] = error
+    else:
+        result["sales_order"] = sales_order
+    if duplicate:
+        result["duplicate"] = True
+    if duplicate_of is not None:
+        result["duplicate_of"] = duplicate_of
+    return result
+
+
+def build_sales_order(data):
     # 📝 Ensure the correct doctype
     data["doctype"] = "Sales Order"
 
@@ -47,74 +622,34 @@ def create_sales_order():
             tax.eta_tax_sub_type = "V001" 
 
     so_doc.run_method("calculate_taxes_and_totals")
+    return so_doc
 
-    so_doc.insert(ignore_permissions=True)
 
-    # 🚀 Optionally submit if flag provided
-    if data.get('is_submittable'):
-        so_doc.submit()
-
-    frappe.db.commit()
-
-    if data.get('is_submittable'):
-        create_sales_invoice(so_doc)
-
-    # 📤 Return the inserted Sales Order as dictionary
-    return so_doc.as_dict()
-
-
-def validate_required_fields(data, fields):
-    # ❗ Check if required fields exist, throw error if missing
-    for field in fields:
-        if not data.get(field):
-            frappe.throw(f"Missing required field: {field}")
+def validate_order(data):
+    # ❗ Every problem with an order payload in one message, or None when it is valid
+    return "; ".join(ORDER_SCHEMA(data)) or None
 
 
 def validate_customer(customer):
-    # 👤 Check if customer exists, else create new one
-    existing_customer = frappe.get_value("Customer", {"customer_name": customer}, "name")
-    if not existing_customer:
-        existing_customer = frappe.get_value("Customer", {"name": customer}, "name")
-    if existing_customer:
-        return existing_customer
-
-    customer_doc = frappe.get_doc({
-        "doctype": "Customer",
-        "customer_name": customer,
-        "customer_type": "Individual"
-    })
-    customer_doc.insert(ignore_permissions=True)
-    frappe.db.commit()
-
-    return customer_doc.name
+    # 👤 Check if customer exists, else create new one (safe against concurrent requests)
+    return get_or_create_name("Customer", customer, create_customer)
 
 
 def validate_warehouse(warehouse):
-    # 🏢 Check if warehouse exists, else create new one
-    existing_warehouse = frappe.get_value("Warehouse", {"warehouse_name": warehouse}, "name")
-    if not existing_warehouse:
-        existing_warehouse = frappe.get_value("Warehouse", {"name": warehouse}, "name")
-    if existing_warehouse:
-        return existing_warehouse
-
-    warehouse_doc = frappe.get_doc({
-        "doctype": "Warehouse",
-        "warehouse_name": warehouse,
-    })
-    warehouse_doc.insert(ignore_permissions=True)
-    frappe.db.commit()
-
-    return warehouse_doc.name
+    # 🏢 Check if warehouse exists, else create new one (safe against concurrent requests)
+    return get_or_create_name("Warehouse", warehouse, create_warehouse)
 
 
 def validate_items(items):
     # 📦 Validate each item and it's details
-    validated_items = []
-    for item in items:
+    # 🔎 One set-based lookup warms the resolution cache for every line
+    resolve_names("Item", [item.get("item_code") for item in items])
+
+    # 🔒 New items are created in code order so concurrent orders lock them in the same order
+    for item in sorted(items, key=lambda item: cstr(item.get("item_code"))):
         item["item_code"] = validate_item(item)
         item['price_list_rate'] = item.get('rate', 0) or 0  # 💲 Ensure price field is set
-        validated_items.append(item)
-    return validated_items
+    return items
 
 
 def validate_item_group(item_group):
@@ -122,73 +657,44 @@ def validate_item_group(item_group):
     if not item_group:
         return "All Item Groups"
 
-    existing_item_group = frappe.get_value("Item Group", {"item_group_name": item_group}, "name")
-    if not existing_item_group:
-        existing_item_group = frappe.get_value("Item Group", {"name": item_group}, "name")
-    if existing_item_group:
-        return existing_item_group
-
-    item_group_doc = frappe.get_doc({
-        "doctype": "Item Group",
-        "item_group_name": item_group,
-        "parent_item_group": "All Item Groups",
-        "is_group": 0
-    })
-    item_group_doc.insert(ignore_permissions=True)
-    frappe.db.commit()
-
-    return item_group_doc.name
+    return get_or_create_name("Item Group", item_group, create_item_group)
 
 
 def validate_item(item_data):
     # 🛒 Check if item exists, else create new one
     item_code = item_data.get("item_code")
-    item_group = item_data.get("item_group") or "اونلاين"
-
-    existing_item = frappe.get_value("Item", {"item_code": item_code}, "name")
-    if not existing_item:
-        existing_item = frappe.get_value("Item", {"name": item_code}, "name")
-    if not existing_item:
-        existing_item = frappe.get_value("Item", {"item_name": item_code}, "name")
-    if not existing_item:
-        existing_item = frappe.get_value("Item", {"custom_item_id": item_code}, "name")
-    if existing_item:
-        return existing_item
-
-    item_doc = frappe.get_doc({
-        "doctype": "Item",
-        "item_code": item_code,
-        "item_name": item_code,
-        "item_group": item_group,
-        "stock_uom": "Nos",
-        "is_stock_item": 1,
-    })
-    
-    item_doc.insert(ignore_permissions=True)
-    item_doc.append("taxes", {
-        "item_tax_template": "الضريبة القياسية %15 - ذهول",
-    })
-    item_doc.save(ignore_permissions=True)
-    frappe.db.commit()
+    item_group = item_data.get("item_group") or DEFAULT_ITEM_GROUP
 
-    return item_doc.name
+    # 🔎 Matches item_code, then name, item_name and custom_item_id (cached)
+    return get_or_create_name("Item", item_code, lambda key: create_item(key, item_group))
 
 
 @frappe.whitelist()
-def submit_sales_order(order_id):
+@instrument("submit_sales_order")
+def submit_sales_order(order_id, is_async=None):
     try:
         # Fetch the Sales Order using the po_no field
-        so_doc = frappe.get_doc('Sales Order', {"po_no": order_id})
-
-        if not so_doc:
-            return f"No Sales Order found with PO No: {order_id}"
+        order = get_order_by_po_no(order_id)
+        if not order:
+            raise frappe.DoesNotExistError
+        so_doc = frappe.get_doc('Sales Order', order.name)
 
         # Check if it's already submitted
-        if so_doc.docstatus == 0:
-            so_doc.submit()
+        if so_doc.docstatus == 0 and use_async_submit({"is_async": is_async}):
+            enqueue_submit_and_invoice(so_doc.name)
             frappe.db.commit()
 
+            return {
+                "status": "queued",
+                "message": f"Sales Order {so_doc.name} has been queued for submission."
+            }
+
+        if so_doc.docstatus == 0:
+            with phase("submit"):
+                so_doc.submit()
+
             create_sales_invoice(so_doc)
+            frappe.db.commit()
 
         return {
             "status": "success",
@@ -211,77 +717,151 @@ def submit_sales_order(order_id):
 
 
 @frappe.whitelist()
-def cancel_sales_order(order_id):
-    # lookup sales order by PO number
-    so = frappe.get_doc("Sales Order", {"po_no": order_id})
-    if not so:
-        return f"No Sales Order found for PO No: {order_id}"
+@instrument("cancel_sales_order")
+def cancel_sales_order(order_id, savepoint_per_document=0):
+    with phase("resolution"):
+        # lookup sales order by PO number
+        order = get_order_by_po_no(order_id)
+        if not order:
+            return f"No Sales Order found for PO No: {order_id}"
+        so = frappe.get_doc("Sales Order", order.name)
 
-    cancelled_invoices = []
-    cancelled_payments = []
-    errors = []
+        # fetch every linked invoice and payment with two set-based queries
+        invoices = get_linked_invoices([so.name])
+        payments = get_linked_payments([inv for names in invoices.values() for inv in names])
 
-    # find all Sales Invoices that reference this Sales Order in Sales Invoice Item
-    invoice_rows = frappe.db.sql("""
-        SELECT DISTINCT sii.parent AS invoice_name
-        FROM `tabSales Invoice Item` AS sii
-        WHERE sii.sales_order = %s
-    """, (so.name,), as_dict=True)
+    with phase("cancel"):
+        result = cancel_order_cascade(so, invoices.get(so.name, []), payments, cint(savepoint_per_document))
+        frappe.db.commit()
+    return result
 
-    invoice_names = [r.invoice_name for r in invoice_rows]
 
-    # Cancel related Payment Entries first (those linked to each invoice)
-    for inv_name in invoice_names:
-        try:
-            # find Payment Entries that reference this invoice
-            payment_rows = frappe.db.sql("""
-                SELECT DISTINCT per.parent AS payment_name
-                FROM `tabPayment Entry Reference` AS per
-                WHERE 
-                    per.reference_name = %s
-                    AND per.reference_doctype = 'Sales Invoice'
-            """, (inv_name,), as_dict=True)
-
-            for prow in payment_rows:
-                pe_name = prow.payment_name
-                try:
-                    pe = frappe.get_doc("Payment Entry", pe_name)
-                    if pe.docstatus == 1:
-                        pe.cancel()
-                        frappe.db.commit()
-                        cancelled_payments.append(pe_name)
-                except Exception as e:
-                    errors.append(f"Payment Entry {pe_name} cancel error: {e}")
-        except Exception as e:
-            errors.append(f"Error finding payments for invoice {inv_name}: {e}")
+@frappe.whitelist()
+@instrument("cancel_sales_orders_bulk")
+def cancel_sales_orders_bulk(order_ids, savepoint_per_document=0, chunk_size=DEFAULT_BULK_CHUNK_SIZE):
+    # cancel many orders (by PO number), committing once per chunk of orders
+    order_ids = frappe.parse_json(order_ids)
+    if not order_ids or not isinstance(order_ids, list):
+        frappe.throw("order_ids must be a list with at least one order id")
+    chunk_size = cint(chunk_size) or len(order_ids)
+
+    # PO numbers compare case-insensitively, and a live order wins over a cancelled one
+    orders = {}
+    for row in frappe.get_all(
+        "Sales Order",
+        filters={"po_no": ["in", order_ids]},
+        fields=["name", "po_no", "docstatus"],
+        order_by="creation asc",
+    ):
+        key = cstr(row.po_no).casefold()
+        if key not in orders or (orders[key].docstatus == 2 and row.docstatus < 2):
+            orders[key] = row
+
+    invoices = get_linked_invoices([row.name for row in orders.values()])
+    payments = get_linked_payments([inv for names in invoices.values() for inv in names])
+
+    results = []
+    for chunk_start in range(0, len(order_ids), chunk_size):
+        for order_id in order_ids[chunk_start:chunk_start + chunk_size]:
+            order = orders.get(cstr(order_id).casefold())
+            if not order:
+                results.append({
+                    "order_id": order_id,
+                    "status": "Failure",
+                    "errors": [f"No Sales Order found for PO No: {order_id}"],
+                })
+                continue
+
+            so = frappe.get_doc("Sales Order", order.name)
+            result = cancel_order_cascade(so, invoices.get(order.name, []), payments, cint(savepoint_per_document))
+            results.append({"order_id": order_id, **result})
+
+        frappe.db.commit()
+
+    return results
+
+
+def get_linked_invoices(sales_orders):
+    # {sales order: [sales invoice, ...]} found through Sales Invoice Item
+    if not sales_orders:
+        return {}
 
-    # Cancel the Sales Invoices
-    for inv_name in invoice_names:
+    invoice_rows = frappe.db.sql("""
+        SELECT DISTINCT sii.sales_order, sii.parent AS invoice_name
+        FROM `tabSales Invoice Item` AS sii
+        WHERE sii.sales_order IN %(sales_orders)s
+    """, {"sales_orders": tuple(sales_orders)}, as_dict=True)
+
+    invoices = {}
+    for row in invoice_rows:
+        invoices.setdefault(row.sales_order, []).append(row.invoice_name)
+    return invoices
+
+
+def get_linked_payments(invoice_names):
+    # {sales invoice: [submitted payment entry, ...]} found through Payment Entry Reference
+    if not invoice_names:
+        return {}
+
+    payment_rows = frappe.db.sql("""
+        SELECT DISTINCT per.reference_name AS invoice_name, per.parent AS payment_name
+        FROM `tabPayment Entry Reference` AS per
+        JOIN `tabPayment Entry` AS pe ON pe.name = per.parent
+        WHERE
+            per.reference_doctype = 'Sales Invoice'
+            AND per.reference_name IN %(invoices)s
+            AND pe.docstatus = 1
+    """, {"invoices": tuple(invoice_names)}, as_dict=True)
+
+    payments = {}
+    for row in payment_rows:
+        payments.setdefault(row.invoice_name, []).append(row.payment_name)
+    return payments
+
+
+def cancel_order_cascade(so, invoice_names, payments, savepoint_per_document=False):
+    # Cancel payments, then invoices, then the order inside the current transaction.
+    # By default the first failure rolls the whole order back; with
+    # savepoint_per_document only the failing document is rolled back.
+    cancelled_invoices = []
+    cancelled_payments = []
+    errors = []
+
+    steps = [
+        ("Payment Entry", pe_name, cancelled_payments)
+        for pe_name in dict.fromkeys(pe for inv in invoice_names for pe in payments.get(inv, []))
+    ]
+    steps += [("Sales Invoice", inv_name, cancelled_invoices) for inv_name in invoice_names]
+    steps.append(("Sales Order", so.name, None))
+
+    frappe.db.savepoint("cancel_order")
+    for doctype, name, cancelled in steps:
+        if savepoint_per_document:
+            frappe.db.savepoint("cancel_document")
         try:
-            invoice = frappe.get_doc("Sales Invoice", inv_name)
-            
-            # reload to avoid concurrency issue
-            invoice.reload()
-            
-            if invoice.docstatus == 1:
-                invoice.cancel()
-                frappe.db.commit()
-                cancelled_invoices.append(inv_name)
+            if doctype == "Sales Order":
+                # reload, cancelling the invoices updated the order
+                so.reload()
+                doc = so
+            else:
+                doc = frappe.get_doc(doctype, name)
+
+            if doc.docstatus == 1:
+                doc.cancel()
+                if cancelled is not None:
+                    cancelled.append(name)
         except Exception as e:
-            errors.append(f"Sales Invoice {inv_name} cancel error: {e}")
-
-    # Finally cancel the Sales Order itself
-    try:
-        # reload to avoid concurrency issue
-        so.reload()
-
-        if so.docstatus == 1:
-            so.cancel()
-            frappe.db.commit()
-        else:
-            pass
-    except Exception as e:
-        errors.append(f"Sales Order {so.name} cancel error: {e}")
+            frappe.clear_messages()
+            errors.append(f"{doctype} {name} cancel error: {e}")
+            if not savepoint_per_document:
+                break
+            frappe.db.rollback(save_point="cancel_document")
+
+    if errors and not savepoint_per_document:
+        # nothing of this order stays half-cancelled
+        frappe.db.rollback(save_point="cancel_order")
+        cancelled_invoices.clear()
+        cancelled_payments.clear()
 
     return {
         "status": "Success" if not errors else "Failure",
@@ -293,43 +873,15 @@ def cancel_sales_order(order_id):
 
 
 def ensure_missing_fields():
-    # Create custom field 'mode_of_payment' in Sales Order if it doesn't exist.
-    if not frappe.db.exists("Custom Field", {"dt": "Sales Order", "fieldname": "custom_mode_of_payment"}):
-        create_custom_field(
-            "Sales Order",
-            {
-                "fieldname": "custom_mode_of_payment",
-                "label": "Mode of Payment",
-                "fieldtype": "Link",
-                "options": "Mode of Payment",
-                "insert_after": "payment_terms_template",
-                "reqd": 0,
-                "hidden": 1,
-            }
-        )
-    if not frappe.db.exists("Custom Field", {"dt": "Sales Order", "fieldname": "custom_shipping_company"}):
-        create_custom_field(
-            "Sales Order",
-            {
-                "fieldname": "custom_shipping_company",
-                "label": "Shipping Company",
-                "fieldtype": "Link",
-                "options": "Shipping Company",
-                "insert_after": "payment_terms_template",
-                "reqd": 0,
-                "hidden": 1,
-            }
-        )
-    if not frappe.db.exists("Custom Field", {"dt": "Sales Order", "fieldname": "custom_shipping_amount"}):
-        create_custom_field(
-            "Sales Order",
-            {
-                "fieldname": "custom_shipping_amount",
-                "label": "Shipping Amount",
-                "fieldtype": "Float",
-                "insert_after": "payment_terms_template",
-                "reqd": 0,
-                "hidden": 1,
-            }
-        )
-    frappe.db.commit()
\ No newline at end of file
+    # 🔒 Custom fields are created on install and migrate, this only covers sites
+    # that have not been migrated yet and is free after the first call per process
+    if frappe.local.site in _checked_sites:
+        return
+
+    for doctype, fields in CUSTOM_FIELDS.items():
+        meta = frappe.get_meta(doctype)
+        if not all(meta.has_field(df["fieldname"]) for df in fields):
+            make_custom_fields()
+            break
+
+    _checked_sites.add(frappe.local.site)
@@ -0,0 +1,184 @@
+import frappe
+from frappe.utils import cint, cstr
+
+from iban_ecommerce.utils.master_data import (
+    DEFAULT_ITEM_GROUP,
+    DEFAULT_ITEM_TAX_TEMPLATE,
+    create_item,
+    get_or_create_names,
+)
+from iban_ecommerce.utils.master_data_cache import clear_master_data_cache
+from iban_ecommerce.utils.metrics import instrument, phase
+from iban_ecommerce.utils.schema import compile_schema
+
+# 📦 Products written per transaction by upsert_items (0 = one transaction)
+DEFAULT_BULK_CHUNK_SIZE = 200
+
+# ✅ Payload schemas, compiled once at import
+PRODUCT_SCHEMA = compile_schema({
+    "item_code": {"type": "code", "required": True},
+    "item_name": {"type": "string"},
+    "item_group": {"type": "string"},
+    "custom_item_id": {"type": "code"},
+    "item_tax_template": {"type": "string"},
+})
+CATALOG_SCHEMA = compile_schema({
+    "items": {"type": "list", "required": True, "min_items": 1},
+    "chunk_size": {"type": "integer"},
+})
+
+# Item fields a product may change, compared before anything is written. An existing
+# item only gets the ones the product sends (not null), a new one gets defaults for the rest.
+SYNCED_FIELDS = ("item_name", "item_group", "custom_item_id", "item_tax_template")
+
+
+@frappe.whitelist()
+@instrument("upsert_items")
+def upsert_items():
+    # 📥 Accept either {"items": [...], "chunk_size": n} or a bare list of products
+    data = frappe.request.get_json()
+    if isinstance(data, list):
+        data = {"items": data}
+    errors = CATALOG_SCHEMA(data)
+    if errors:
+        frappe.throw("; ".join(errors))
+
+    products = data["items"]
+    chunk_size = cint(data.get("chunk_size")) if data.get("chunk_size") is not None else DEFAULT_BULK_CHUNK_SIZE
+    if chunk_size <= 0:
+        chunk_size = len(products)
+
+    results = [None] * len(products)
+    pending = {}
+
+    with phase("validation"):
+        # ✅ Validate every product, the first one of a repeated item_code wins
+        for idx, product in enumerate(products):
+            errors = PRODUCT_SCHEMA(product)
+            if errors:
+                results[idx] = item_result(idx, product, "error", message="; ".join(errors))
+            elif cstr(product["item_code"]).casefold() in pending:
+                results[idx] = item_result(idx, product, "error", message="Duplicate item_code in request")
+            else:
+                pending[cstr(product["item_code"]).casefold()] = (idx, product)
+
+    # 🔎 Diff the whole catalog against existing Items with a few set-based queries
+    with phase("resolution"):
+        existing = get_existing_items({cstr(product["item_code"]) for _, product in pending.values()})
+        pending = [
+            (idx, product, existing.get(code), get_item_values(product, is_new=code not in existing))
+            for code, (idx, product) in pending.items()
+        ]
+        groups, group_errors = get_or_create_names(
+            "Item Group", {values["item_group"] for _, _, _, values in pending if "item_group" in values}
+        )
+        templates = set(frappe.get_all(
+            "Item Tax Template",
+            filters={"name": ["in", list({v["item_tax_template"] for _, _, _, v in pending if "item_tax_template" in v})]},
+            pluck="name",
+        ))
+
+    for chunk_start in range(0, len(pending), chunk_size):
+        updated = False
+        for idx, product, current, values in pending[chunk_start:chunk_start + chunk_size]:
+            if "item_group" in values:
+                if values["item_group"] in group_errors:
+                    results[idx] = item_result(idx, product, "error", message=group_errors[values["item_group"]])
+                    continue
+                values["item_group"] = groups[values["item_group"]]
+            if "item_tax_template" in values and values["item_tax_template"] not in templates:
+                results[idx] = item_result(idx, product, "error", message=f"Item Tax Template {values['item_tax_template']} not found")
+                continue
+
+            if current and all(cstr(current[field]) == cstr(value) for field, value in values.items()):
+                results[idx] = item_result(idx, product, "unchanged", name=current.name)
+                continue
+
+            # 💾 One write per item, tax rows included
+            frappe.db.savepoint("catalog_item")
+            try:
+                with phase("write"):
+                    if current:
+                        name = update_item(current.name, values)
+                        updated = True
+                    else:
+                        name = create_item(cstr(product["item_code"]), **values)
+                results[idx] = item_result(idx, product, "updated" if current else "created", name=name)
+            except Exception as e:
+                frappe.db.rollback(save_point="catalog_item")
+                frappe.clear_messages()
+                results[idx] = item_result(idx, product, "error", message=str(e))
+
+        frappe.db.commit()
+        if updated:
+            # Updated items may answer other lookups now, once per chunk and after the commit
+            clear_master_data_cache("Item")
+
+    counts = {status: sum(1 for result in results if result["status"] == status) for status in ("created", "updated", "unchanged", "error")}
+    return {
+        "status": "success" if not counts["error"] else "partial" if counts["error"] < len(results) else "error",
+        "created": counts["created"],
+        "updated": counts["updated"],
+        "unchanged": counts["unchanged"],
+        "failed": counts["error"],
+        "results": results,
+    }
+
+
+def get_item_values(product, is_new):
+    # {field: value} to write, None is "not sent" while "" clears custom_item_id
+    defaults = {
+        "item_name": cstr(product["item_code"]),
+        "item_group": DEFAULT_ITEM_GROUP,
+        "custom_item_id": None,
+        "item_tax_template": DEFAULT_ITEM_TAX_TEMPLATE,
+    }
+    return {
+        field: (cstr(product.get(field)) or defaults[field])
+        for field in SYNCED_FIELDS
+        if is_new or product.get(field) is not None
+    }
+
+
+def get_existing_items(item_codes):
+    # {casefolded item_code: item row with its first item tax template}
+    if not item_codes:
+        return {}
+
+    rows = frappe.db.sql("""
+        SELECT i.name, i.item_code, i.item_name, i.item_group, i.custom_item_id,
+            (
+                SELECT it.item_tax_template FROM `tabItem Tax` it
+                WHERE it.parenttype = 'Item' AND it.parent = i.name
+                ORDER BY it.idx ASC LIMIT 1
+            ) AS item_tax_template
+        FROM `tabItem` i
+        WHERE i.item_code IN %(item_codes)s
+    """, {"item_codes": tuple(item_codes)}, as_dict=True)
+    return {row.item_code.casefold(): row for row in rows}
+
+
+def update_item(name, values):
+    values = dict(values)
+    item_tax_template = values.pop("item_tax_template", None)
+    item_doc = frappe.get_doc("Item", name)
+    item_doc.update(values)
+    if item_tax_template:
+        item_doc.set("taxes", [{"item_tax_template": item_tax_template}])
+    # The master data cache is cleared once per chunk by upsert_items
+    item_doc.flags.skip_master_data_cache_clear = True
+    item_doc.save(ignore_permissions=True)
+    return item_doc.name
+
+
+def item_result(idx, product, status, name=None, message=None):
+    result = {
+        "index": idx,
+        "item_code": product.get("item_code") if isinstance(product, dict) else None,
+        "status": status,
+    }
+    if name:
+        result["item"] = name
+    if message:
+        result["message"] = message
+    return result
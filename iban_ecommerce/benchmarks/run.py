@@ -0,0 +1,233 @@
+# Drive the order-to-cash APIs of a local test site and report throughput,
+# latency percentiles and SQL statements per call:
+#
+#   python -m iban_ecommerce.benchmarks.run --url http://test_site:8000 \
+#       --api-key KEY --api-secret SECRET --catalog catalog.json \
+#       --site test_site --bench-dir ~/frappe-bench \
+#       --orders 500 --lines 5 --concurrency 16 --save baseline.json
+#
+# Pass --compare baseline.json to fail (exit code 1) when throughput, p95 latency
+# or queries per call of a scenario regress beyond --tolerance.
+# The API key must belong to a System Manager, queries per call are read from
+# the app's metrics endpoint before and after every scenario. --site and --bench-dir
+# locate the bench the site runs on, the invoices of the payment scenario are
+# prepared there with bench execute.
+
+import argparse
+import json
+import random
+import subprocess
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import requests
+
+API = "/api/method/iban_ecommerce.apis"
+ENDPOINTS = {
+    "create_sales_order": f"{API}.selling.sales_order.sales_order.create_sales_order",
+    "submit_sales_order": f"{API}.selling.sales_order.sales_order.submit_sales_order",
+    "cancel_sales_order": f"{API}.selling.sales_order.sales_order.cancel_sales_order",
+    "create_payment_entry": f"{API}.accounts.payment_entry.payment_entry.create_payment_entry",
+    "get_metrics": f"{API}.metrics.metrics.get_metrics",
+}
+
+
+class Benchmark:
+    def __init__(self, args, catalog):
+        self.args = args
+        self.catalog = catalog
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=args.concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Authorization"] = f"token {args.api_key}:{args.api_secret}"
+
+    def post(self, endpoint, payload):
+        started = time.perf_counter()
+        response = self.session.post(self.args.url + ENDPOINTS[endpoint], json=payload, timeout=300)
+        return time.perf_counter() - started, succeeded(response)
+
+    def order(self, is_submittable):
+        today = date.today().isoformat()
+        return {
+            "po_no": f"BENCH-{uuid.uuid4().hex[:16]}",
+            "customer": random.choice(self.catalog["customers"]),
+            "set_warehouse": self.catalog["warehouse"],
+            "transaction_date": today,
+            "delivery_date": today,
+            "custom_mode_of_payment": self.catalog["mode_of_payment"],
+            "is_submittable": int(is_submittable),
+            # Measure the whole pipeline, the async mode would only time the enqueue
+            "is_async": 0,
+            "items": [
+                {"item_code": item_code, "qty": random.randint(1, 5), "rate": random.randint(10, 500)}
+                for item_code in random.sample(self.catalog["items"], self.args.lines)
+            ],
+        }
+
+    def make_invoices_payable(self, order_ids, chunk_size=100):
+        for start in range(0, len(order_ids), chunk_size):
+            subprocess.run([
+                "bench", "--site", self.args.site, "execute",
+                "iban_ecommerce.benchmarks.seed.make_invoices_payable",
+                "--kwargs", json.dumps({"order_ids": order_ids[start:start + chunk_size]}),
+            ], cwd=self.args.bench_dir, check=True, stdout=subprocess.DEVNULL)
+
+    def query_totals(self, endpoint):
+        # (sum of queries, number of calls) recorded so far for an endpoint
+        response = self.session.get(self.args.url + ENDPOINTS["get_metrics"], timeout=60)
+        response.raise_for_status()
+        totals = {}
+        labels = f'endpoint="{endpoint}",phase="total"'
+        for line in response.text.splitlines():
+            for suffix in ("sum", "count"):
+                if line.startswith(f"iban_ecommerce_db_queries_{suffix}{{{labels}}}"):
+                    totals[suffix] = float(line.rsplit(" ", 1)[1])
+        return totals.get("sum", 0), totals.get("count", 0)
+
+    def scenario(self, name, endpoint, payloads):
+        queries_before, calls_before = self.query_totals(endpoint)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+            results = list(pool.map(lambda payload: self.post(endpoint, payload), payloads))
+        elapsed = time.perf_counter() - started
+        queries_after, calls_after = self.query_totals(endpoint)
+
+        latencies = sorted(latency for latency, _ in results)
+        calls = calls_after - calls_before
+        return {
+            "scenario": name,
+            "calls": len(results),
+            "errors": sum(1 for _, ok in results if not ok),
+            "throughput": round(len(results) / elapsed, 2) if elapsed else 0,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "queries_per_call": round((queries_after - queries_before) / calls, 1) if calls else None,
+        }
+
+    def run(self):
+        count = self.args.orders
+        drafts = [self.order(is_submittable=False) for _ in range(count)]
+        submitted = [self.order(is_submittable=True) for _ in range(count)]
+
+        results = [
+            self.scenario("create_sales_order (draft)", "create_sales_order", drafts),
+            self.scenario("create_sales_order (is_submittable)", "create_sales_order", submitted),
+            self.scenario("submit_sales_order", "submit_sales_order", [
+                {"order_id": order["po_no"], "is_async": 0} for order in drafts
+            ]),
+        ]
+        # Untimed: the orders' draft POS invoices cannot be paid until submitted as credit sales
+        self.make_invoices_payable([order["po_no"] for order in submitted])
+
+        return [
+            *results,
+            self.scenario("create_payment_entry", "create_payment_entry", [
+                {"order_id": order["po_no"], "mode_of_payment": self.catalog["mode_of_payment"]}
+                for order in submitted
+            ]),
+            self.scenario("cancel_sales_order", "cancel_sales_order", [
+                {"order_id": order["po_no"]} for order in submitted
+            ]),
+        ]
+
+
+def succeeded(response):
+    # HTTP errors and the APIs' own {"status": "error" / "Failure"} answers count as failures
+    if not response.ok:
+        return False
+    message = response.json().get("message")
+    if isinstance(message, dict):
+        return str(message.get("status") or message.get("Status") or "").lower() not in ("error", "failure")
+    return message is not None
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+    return round(values[index] * 1000, 1)
+
+
+def compare(results, baseline, tolerance):
+    # Regressions of throughput, p95 latency or queries per call beyond the tolerance
+    previous = {row["scenario"]: row for row in baseline["results"]}
+    regressions = []
+    for row in results:
+        base = previous.get(row["scenario"])
+        if not base:
+            continue
+        if base["throughput"] and row["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{row['scenario']}: throughput {row['throughput']}/s < {base['throughput']}/s")
+        if base["p95"] and row["p95"] > base["p95"] * (1 + tolerance):
+            regressions.append(f"{row['scenario']}: p95 {row['p95']}ms > {base['p95']}ms")
+        if base["queries_per_call"] is not None and row["queries_per_call"] is not None:
+            if row["queries_per_call"] > base["queries_per_call"] * (1 + tolerance):
+                regressions.append(
+                    f"{row['scenario']}: {row['queries_per_call']} queries/call > {base['queries_per_call']}"
+                )
+    return regressions
+
+
+def print_report(results):
+    columns = ("scenario", "calls", "errors", "throughput", "p50", "p95", "p99", "queries_per_call")
+    print(" | ".join(columns))
+    for row in results:
+        print(" | ".join(str(row[column]) for column in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Order-to-cash API benchmark")
+    parser.add_argument("--url", required=True, help="Site URL, e.g. http://test_site:8000")
+    parser.add_argument("--api-key", required=True)
+    parser.add_argument("--api-secret", required=True)
+    parser.add_argument("--catalog", required=True, help="JSON printed by benchmarks.seed.seed_catalog")
+    parser.add_argument("--site", required=True, help="Site name for bench execute")
+    parser.add_argument("--bench-dir", default=".", help="Bench directory the site runs on")
+    parser.add_argument("--orders", type=int, default=200, help="Orders per scenario")
+    parser.add_argument("--lines", type=int, default=5, help="Items per order")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for reproducible payloads")
+    parser.add_argument("--save", help="Write the results as a JSON baseline")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed regression, 0.1 = 10%%")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    with open(args.catalog) as f:
+        catalog = json.load(f)
+
+    results = Benchmark(args, catalog).run()
+    print_report(results)
+
+    # A scenario where every call failed measured nothing, never save or compare it
+    failed = [row["scenario"] for row in results if row["calls"] and row["errors"] == row["calls"]]
+    if failed:
+        print(f"ERROR every call failed: {', '.join(failed)}")
+        return 1
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "orders": args.orders,
+                "lines": args.lines,
+                "concurrency": args.concurrency,
+                "results": results,
+            }, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
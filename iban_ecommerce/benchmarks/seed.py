@@ -0,0 +1,119 @@
+# Seed a local test site with a catalog for the order-to-cash benchmark:
+#
+#   bench --site test_site execute iban_ecommerce.benchmarks.seed.seed_catalog \
+#       --kwargs "{'customers': 200, 'items': 500}" > catalog.json
+#
+# The printed catalog is the --catalog input of iban_ecommerce.benchmarks.run.
+# Seeding is idempotent, records that already exist are left alone.
+# Nothing here is whitelisted, the runner calls make_invoices_payable through bench execute.
+
+import frappe
+from frappe.utils import random_string
+
+PREFIX = "BENCH"
+TAX_RATES = (15, 5, 0)
+
+
+def seed_catalog(customers=200, items=500, prefix=PREFIX):
+    company = frappe.db.get_single_value("Global Defaults", "default_company")
+    if not company:
+        frappe.throw("Set a default company on the benchmark site before seeding")
+    abbr = frappe.get_cached_value("Company", company, "abbr")
+
+    item_group = get_or_insert("Item Group", f"{prefix} Items", {
+        "item_group_name": f"{prefix} Items",
+        "parent_item_group": "All Item Groups",
+    })
+    warehouse = get_or_insert("Warehouse", f"{prefix} Stores - {abbr}", {
+        "warehouse_name": f"{prefix} Stores",
+        "company": company,
+    })
+    tax_account = get_tax_account(company, abbr, prefix)
+    templates = [
+        get_or_insert("Item Tax Template", f"{prefix} VAT {rate}% - {abbr}", {
+            "title": f"{prefix} VAT {rate}%",
+            "company": company,
+            "taxes": [{"tax_type": tax_account, "tax_rate": rate}],
+        })
+        for rate in TAX_RATES
+    ]
+    mode_of_payment = get_or_insert("Mode of Payment", f"{prefix} Cash", {
+        "mode_of_payment": f"{prefix} Cash",
+        "type": "Cash",
+        "accounts": [{
+            "company": company,
+            "default_account": frappe.get_cached_value("Company", company, "default_cash_account"),
+        }],
+    })
+
+    for idx in range(int(items)):
+        item_code = f"{prefix}-ITEM-{idx:05d}"
+        get_or_insert("Item", item_code, {
+            "item_code": item_code,
+            "item_name": f"{prefix} Item {idx}",
+            "item_group": item_group,
+            "stock_uom": "Nos",
+            # Non-stock items, the benchmark measures the APIs and not stock levels
+            "is_stock_item": 0,
+            "custom_item_id": random_string(12),
+            "taxes": [{"item_tax_template": templates[idx % len(templates)]}],
+        })
+
+    for idx in range(int(customers)):
+        get_or_insert("Customer", f"{prefix} Customer {idx:05d}", {
+            "customer_name": f"{prefix} Customer {idx:05d}",
+            "customer_type": "Individual",
+        })
+
+    frappe.db.commit()
+
+    return {
+        "company": company,
+        "warehouse": warehouse,
+        "mode_of_payment": mode_of_payment,
+        "customers": [f"{prefix} Customer {idx:05d}" for idx in range(int(customers))],
+        "items": [f"{prefix}-ITEM-{idx:05d}" for idx in range(int(items))],
+    }
+
+
+def make_invoices_payable(order_ids):
+    # The invoice job leaves draft POS invoices, submit those of the given orders as
+    # credit sales so the payment scenario has an outstanding amount to pay
+    invoices = frappe.db.sql("""
+        SELECT DISTINCT sii.parent
+        FROM `tabSales Invoice Item` sii
+        JOIN `tabSales Order` so ON so.name = sii.sales_order
+        WHERE so.po_no IN %(order_ids)s AND sii.docstatus = 0
+    """, {"order_ids": tuple(order_ids)}, pluck=True) if order_ids else []
+
+    for name in invoices:
+        invoice = frappe.get_doc("Sales Invoice", name)
+        invoice.is_pos = 0
+        invoice.payments = []
+        invoice.save()
+        invoice.submit()
+        frappe.db.commit()
+
+    return len(invoices)
+
+
+def get_or_insert(doctype, name, values):
+    if frappe.db.exists(doctype, name):
+        return name
+    doc = frappe.get_doc({"doctype": doctype, **values})
+    doc.insert(ignore_permissions=True)
+    return doc.name
+
+
+def get_tax_account(company, abbr, prefix):
+    account = frappe.db.get_value("Account", {"company": company, "account_type": "Tax", "is_group": 0}, "name")
+    if account:
+        return account
+
+    parent = frappe.db.get_value("Account", {"company": company, "account_type": "Tax", "is_group": 1}, "name")
+    return get_or_insert("Account", f"{prefix} VAT - {abbr}", {
+        "account_name": f"{prefix} VAT",
+        "company": company,
+        "parent_account": parent,
+        "account_type": "Tax",
+    })
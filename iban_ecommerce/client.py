@@ -0,0 +1,316 @@
+# Python client for the ecommerce APIs, for integration services running outside bench:
+#
+#   client = EcommerceClient("https://erp.example.com", API_KEY, API_SECRET)
+#   client.create_sales_order(order)
+#   futures = [client.submit_order(order) for order in orders]  # grouped into bulk calls
+#   client.close()
+#
+# One pooled keep-alive session is shared by every call. Calls the server can replay
+# safely (orders carry an idempotency key, payments a reference) are retried on
+# 429/502/503/504 and dropped connections; connection errors are always retried.
+# AsyncEcommerceClient offers the same calls to asyncio code with bounded concurrency.
+
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 🌍 Base URL of your ERPNext/Frappe site
+BASE_URL = "http://localhost:8000"
+API_KEY = ""
+API_SECRET = ""
+
+API = "/api/method/iban_ecommerce.apis"
+ENDPOINTS = {
+    "create_sales_order": f"{API}.selling.sales_order.sales_order.create_sales_order",
+    "create_sales_orders_bulk": f"{API}.selling.sales_order.sales_order.create_sales_orders_bulk",
+    "quote_sales_order": f"{API}.selling.sales_order.sales_order.quote_sales_order",
+    "submit_sales_order": f"{API}.selling.sales_order.sales_order.submit_sales_order",
+    "cancel_sales_order": f"{API}.selling.sales_order.sales_order.cancel_sales_order",
+    "get_orders_status": f"{API}.selling.order_status.order_status.get_orders_status",
+    "get_order_changes": f"{API}.selling.order_status.order_status.get_order_changes",
+    "create_payment_entry": f"{API}.accounts.payment_entry.payment_entry.create_payment_entry",
+    "create_payment_entries_bulk": f"{API}.accounts.payment_entry.payment_entry.create_payment_entries_bulk",
+    "upsert_items": f"{API}.stock.item.item.upsert_items",
+}
+
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# Single calls grouped into one bulk call, and how long a call waits for company
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_LINGER = 0.05
+
+
+class EcommerceAPIError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+
+
+class EcommerceClient:
+    def __init__(
+        self,
+        base_url=BASE_URL,
+        api_key=API_KEY,
+        api_secret=API_SECRET,
+        pool_size=16,
+        retries=3,
+        backoff=0.5,
+        timeout=120,
+        batch_size=DEFAULT_BATCH_SIZE,
+        linger=DEFAULT_LINGER,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.linger = linger
+        self.batchers = {}
+        self.lock = threading.Lock()
+
+        # Keep-alive pool sized for the caller's concurrency. urllib3 only retries
+        # failures to connect here, a request that reached the server is retried by
+        # call() when it is safe to replay.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=Retry(total=retries, connect=retries, read=0, status=0, other=0, backoff_factor=backoff),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if api_key and api_secret:
+            self.session.headers["Authorization"] = f"token {api_key}:{api_secret}"
+
+    def call(self, endpoint, payload=None, idempotent=False, idempotency_key=None):
+        # POST to a whitelisted method and return its "message"
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        url = self.base_url + ENDPOINTS[endpoint]
+
+        for attempt in range(self.retries + 1):
+            last_attempt = not idempotent or attempt == self.retries
+            try:
+                response = self.session.post(url, json=payload, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if last_attempt:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                retry_after = response.headers.get("Retry-After")
+                time.sleep(float(retry_after) if retry_after and retry_after.isdigit() else self.backoff * 2 ** attempt)
+                continue
+            if not response.ok:
+                raise EcommerceAPIError(response.status_code, response.text[:1000])
+            return response.json().get("message")
+
+    # Orders: an idempotency key makes every order safe to retry
+
+    def create_sales_order(self, order):
+        order = with_idempotency_key(order)
+        return self.call("create_sales_order", order, idempotent=True, idempotency_key=order["idempotency_key"])
+
+    def create_sales_orders(self, orders, chunk_size=DEFAULT_BATCH_SIZE, **options):
+        # Many orders through the bulk endpoint, results in the order given
+        orders = [with_idempotency_key(order) for order in orders]
+        results = []
+        for start in range(0, len(orders), chunk_size):
+            chunk = orders[start:start + chunk_size]
+            response = self.call("create_sales_orders_bulk", {"orders": chunk, **options}, idempotent=True)
+            results += reindex(response["results"], start)
+        return results
+
+    def quote_sales_order(self, order):
+        return self.call("quote_sales_order", order, idempotent=True)
+
+    def get_orders_status(self, order_ids, chunk_size=5000):
+        orders = []
+        for start in range(0, len(order_ids), chunk_size):
+            orders += self.call("get_orders_status", {"order_ids": order_ids[start:start + chunk_size]}, idempotent=True)["orders"]
+        return orders
+
+    def get_order_changes(self, cursor=None, limit=500):
+        return self.call("get_order_changes", {"cursor": cursor, "limit": limit}, idempotent=True)
+
+    # Payments: only those with a reference can be replayed without paying twice
+
+    def create_payment_entry(self, payment):
+        return self.call("create_payment_entry", payment)
+
+    def create_payment_entries(self, payments, chunk_size=DEFAULT_BATCH_SIZE):
+        results = []
+        for start in range(0, len(payments), chunk_size):
+            chunk = payments[start:start + chunk_size]
+            idempotent = all(payment.get("reference") for payment in chunk)
+            response = self.call("create_payment_entries_bulk", {"payments": chunk}, idempotent=idempotent)
+            results += reindex(response["results"], start)
+        return results
+
+    def upsert_items(self, items, chunk_size=500):
+        results = []
+        for start in range(0, len(items), chunk_size):
+            response = self.call("upsert_items", {"items": items[start:start + chunk_size]}, idempotent=True)
+            results += reindex(response["results"], start)
+        return results
+
+    # Single calls grouped into bulk calls, for callers producing one record at a time
+
+    def submit_order(self, order):
+        # Future of this order's bulk result, sent with up to batch_size others
+        return self.get_batcher("orders", self.create_sales_orders).submit(with_idempotency_key(order))
+
+    def submit_payment(self, payment):
+        return self.get_batcher("payments", self.create_payment_entries).submit(payment)
+
+    def get_batcher(self, name, send):
+        with self.lock:
+            if name not in self.batchers:
+                self.batchers[name] = Batcher(send, self.batch_size, self.linger)
+            return self.batchers[name]
+
+    def flush(self):
+        for batcher in list(self.batchers.values()):
+            batcher.flush()
+
+    def close(self):
+        self.flush()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Batcher:
+    # Collects single records and sends them with one bulk call once batch_size
+    # records are waiting or the oldest one has waited linger seconds
+
+    def __init__(self, send, batch_size=DEFAULT_BATCH_SIZE, linger=DEFAULT_LINGER):
+        self.send = send
+        self.batch_size = batch_size
+        self.linger = linger
+        self.pending = []
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def submit(self, record):
+        future = Future()
+        with self.condition:
+            self.pending.append((record, future))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return future
+
+    def run(self):
+        while True:
+            with self.condition:
+                if not self.pending:
+                    # Cleared under the lock, a record submitted after this starts a new thread
+                    self.thread = None
+                    return
+                deadline = time.monotonic() + self.linger
+                while len(self.pending) < self.batch_size and time.monotonic() < deadline:
+                    self.condition.wait(deadline - time.monotonic())
+                batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            self.send_batch(batch)
+
+    def send_batch(self, batch):
+        try:
+            results = self.send([record for record, _ in batch])
+            if len(results) != len(batch):
+                raise EcommerceAPIError(None, f"{len(results)} results for {len(batch)} records")
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results, strict=True):
+            future.set_result(result)
+
+    def flush(self):
+        # Send whatever is waiting now, in the caller's thread
+        while True:
+            with self.condition:
+                batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            if not batch:
+                return
+            self.send_batch(batch)
+
+
+class AsyncEcommerceClient:
+    # asyncio front of EcommerceClient: calls run in threads over the shared pool,
+    # at most `concurrency` of them at a time
+
+    def __init__(self, *args, concurrency=16, **kwargs):
+        kwargs.setdefault("pool_size", concurrency)
+        self.client = EcommerceClient(*args, **kwargs)
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(self, method, *args, **kwargs):
+        async with self.semaphore:
+            return await asyncio.to_thread(getattr(self.client, method), *args, **kwargs)
+
+    async def create_sales_order(self, order):
+        return await self.run("create_sales_order", order)
+
+    async def create_sales_orders(self, orders, chunk_size=DEFAULT_BATCH_SIZE, **options):
+        # Chunks are sent concurrently, results keep the order given
+        orders = [with_idempotency_key(order) for order in orders]
+        chunks = [orders[start:start + chunk_size] for start in range(0, len(orders), chunk_size)]
+        responses = await asyncio.gather(*(
+            self.run("create_sales_orders", chunk, chunk_size=chunk_size, **options) for chunk in chunks
+        ))
+        return [
+            result
+            for start, results in zip(range(0, len(orders), chunk_size), responses, strict=True)
+            for result in reindex(results, start)
+        ]
+
+    async def quote_sales_order(self, order):
+        return await self.run("quote_sales_order", order)
+
+    async def get_orders_status(self, order_ids, chunk_size=5000):
+        return await self.run("get_orders_status", order_ids, chunk_size=chunk_size)
+
+    async def create_payment_entry(self, payment):
+        return await self.run("create_payment_entry", payment)
+
+    async def create_payment_entries(self, payments, chunk_size=DEFAULT_BATCH_SIZE):
+        chunks = [payments[start:start + chunk_size] for start in range(0, len(payments), chunk_size)]
+        responses = await asyncio.gather(*(self.run("create_payment_entries", chunk, chunk_size) for chunk in chunks))
+        return [
+            result
+            for start, results in zip(range(0, len(payments), chunk_size), responses, strict=True)
+            for result in reindex(results, start)
+        ]
+
+    async def close(self):
+        await asyncio.to_thread(self.client.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+def with_idempotency_key(order):
+    # A copy carrying a key that stays the same across every retry of this order
+    if order.get("idempotency_key"):
+        return order
+    return {**order, "idempotency_key": uuid.uuid4().hex}
+
+
+def reindex(results, offset):
+    # Bulk results index within their chunk, shift them to the caller's list
+    return [{**result, "index": result["index"] + offset} for result in results]
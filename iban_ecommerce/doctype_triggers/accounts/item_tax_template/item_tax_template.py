@@ -0,0 +1,16 @@
+import frappe
+
+from iban_ecommerce.utils.item_tax import clear_item_tax_template_cache
+
+
+@frappe.whitelist()
+def on_update(doc, method=None):
+    clear_item_tax_template_cache()
+
+@frappe.whitelist()
+def after_rename(doc, method=None, old=None, new=None, merge=False):
+    clear_item_tax_template_cache()
+
+@frappe.whitelist()
+def on_trash(doc, method=None):
+    clear_item_tax_template_cache()
@@ -1,12 +1,28 @@
+from datetime import datetime, timedelta
+
 import frappe
 from frappe.model.mapper import get_mapped_doc
+from frappe.utils import get_datetime, getdate
+from iban_ecommerce.utils.checkin_log_type import lock_checkin_day, mark_days_dirty, use_deferred_log_type
 
 @frappe.whitelist()
 def before_insert(doc, method=None):
-    pass
+    # Lock the employee-day before inserting, so a concurrent punch of the same day
+    # waits here instead of on this one's rows
+    if not doc.flags.skip_log_type_update and not use_deferred_log_type():
+        lock_checkin_day(doc.employee, doc.time)
 
 @frappe.whitelist()
 def after_insert(doc, method=None):
+    # Bulk ingestion recomputes each employee-day once after all inserts
+    if doc.flags.skip_log_type_update:
+        return
+
+    # Deferred mode: a background job recomputes the day once for all its new punches
+    if use_deferred_log_type():
+        mark_days_dirty([(doc.employee, doc.time)])
+        return
+
     # Update log Type (IN - Out) For Current Employee
     update_log_type(doc)
 
@@ -39,32 +55,89 @@ def on_update(doc, method=None):
     pass
 
 def update_log_type(doc):
-    # Clear all log_type values for today's checkins of this employee
+    # The first checkin of the day is IN, the last is OUT (when there is more than
+    # one) and every other one is empty. A new checkin can only take over one of
+    # those two places, so only the current first or last checkin is touched.
+    # Runs under the day lock taken in before_insert, the locking reads see punches
+    # committed by the previous holder even under REPEATABLE READ.
+    day_start, day_end = get_day_bounds(doc.time)
+    time = get_datetime(doc.time)
+
+    first = get_boundary_checkin(doc.employee, day_start, day_end, "ASC", exclude=doc.name, for_update=True)
+    if not first:
+        # First checkin of the day → IN
+        set_log_type(doc, "IN")
+        return
+
+    last = get_boundary_checkin(doc.employee, day_start, day_end, "DESC", exclude=doc.name, for_update=True)
+
+    if time < first.time:
+        # New first checkin → IN, the old first one becomes OUT if it was alone
+        set_log_type(doc, "IN")
+        set_log_type(first, "OUT" if first.name == last.name else None)
+    elif time >= last.time:
+        # New last checkin → OUT, the old last one goes back to empty unless it is the IN
+        set_log_type(doc, "OUT")
+        if last.name != first.name:
+            set_log_type(last, None)
+    else:
+        set_log_type(doc, None)
+
+
+def recompute_log_type(employee, day):
+    # Rebuild IN / OUT for a whole employee-day from scratch
+    lock_checkin_day(employee, day)
+    day_start, day_end = get_day_bounds(day)
+
+    # Clear all log_type values for the day's checkins of this employee
     frappe.db.sql("""
         UPDATE `tabEmployee Checkin`
         SET log_type = NULL
         WHERE 
             employee = %s
-            AND DATE(time) = DATE(%s)
-    """, (doc.employee, doc.time))
-
-    # Get all checkins for today sorted by time
-    checkins = frappe.db.sql("""
-        SELECT name
-        FROM `tabEmployee Checkin`
-        WHERE 
-            employee = %s 
-            AND DATE(time) = DATE(%s)
-        ORDER BY time ASC
-    """, (doc.employee, doc.time), as_dict=True)
+            AND time >= %s
+            AND time < %s
+    """, (employee, day_start, day_end))
 
-    if not checkins:
+    # Get the first and last checkins of the day
+    first = get_boundary_checkin(employee, day_start, day_end, "ASC", for_update=True)
+    if not first:
         return
+    last = get_boundary_checkin(employee, day_start, day_end, "DESC", for_update=True)
 
     # First checkin → IN
-    frappe.db.set_value("Employee Checkin", checkins[0].name, "log_type", "IN")
+    frappe.db.set_value("Employee Checkin", first.name, "log_type", "IN")
 
     # If more than one → last checkin → OUT
-    if len(checkins) > 1:
-        frappe.db.set_value("Employee Checkin", checkins[-1].name, "log_type", "OUT")
+    if last.name != first.name:
+        frappe.db.set_value("Employee Checkin", last.name, "log_type", "OUT")
+
+
+def get_day_bounds(value):
+    # Half-open [start, end) range so the (employee, time) index can be used
+    day_start = datetime.combine(getdate(value), datetime.min.time())
+    return day_start, day_start + timedelta(days=1)
 
+
+def get_boundary_checkin(employee, day_start, day_end, order, exclude=None, for_update=False):
+    checkins = frappe.db.sql(f"""
+        SELECT name, time, log_type
+        FROM `tabEmployee Checkin`
+        WHERE 
+            employee = %(employee)s 
+            AND time >= %(day_start)s
+            AND time < %(day_end)s
+            AND name != %(exclude)s
+        ORDER BY time {order}
+        LIMIT 1
+        {"FOR UPDATE" if for_update else ""}
+    """, {"employee": employee, "day_start": day_start, "day_end": day_end, "exclude": exclude or ""}, as_dict=True)
+    return checkins[0] if checkins else None
+
+
+def set_log_type(checkin, log_type):
+    # Write only when the value actually changes
+    if (checkin.log_type or None) == log_type:
+        return
+    frappe.db.set_value("Employee Checkin", checkin.name, "log_type", log_type)
+    checkin.log_type = log_type
@@ -1,5 +1,7 @@
 import frappe
 from frappe.model.mapper import get_mapped_doc
+from iban_ecommerce.utils.item_tax import get_item_tax_index
+from iban_ecommerce.utils.metrics import phase
 
 @frappe.whitelist()
 def before_insert(doc, method=None):
@@ -36,83 +38,85 @@ def on_update(doc, method=None):
     pass
 
 def create_sales_invoice(sales_order):
-    try:
-        invoice = get_mapped_doc(
-            "Sales Order",
-            sales_order.name,
-            {
-                "Sales Order": {
-                    "doctype": "Sales Invoice",
-                    "field_map": {
-                        "name": "sales_order",
-                        "transaction_date": "posting_date",
+    with phase("invoicing"):
+        # A failed invoice only rolls back its own writes, never the Sales Order
+        frappe.db.savepoint("sales_invoice")
+        try:
+            invoice = get_mapped_doc(
+                "Sales Order",
+                sales_order.name,
+                {
+                    "Sales Order": {
+                        "doctype": "Sales Invoice",
+                        "field_map": {
+                            "name": "sales_order",
+                            "transaction_date": "posting_date",
+                        },
+                        "validation": {
+                            "docstatus": ["=", 1],
+                        },
                     },
-                    "validation": {
-                        "docstatus": ["=", 1],
+                    "Sales Order Item": {
+                        "doctype": "Sales Invoice Item",
+                        "field_map": {
+                            "name": "so_detail",
+                            "parent": "sales_order",
+                            "sales_order": "sales_order",
+                        },
                     },
                 },
-                "Sales Order Item": {
-                    "doctype": "Sales Invoice Item",
-                    "field_map": {
-                        "name": "so_detail",
-                        "parent": "sales_order",
-                        "sales_order": "sales_order",
-                    },
-                },
-            },
-            target_doc=None,
-        )
+                target_doc=None,
+            )
 
-        # Set mandatory values
-        invoice.due_date = frappe.utils.nowdate()
-        invoice.update_stock = 1
-        invoice.is_pos = 1
+            # Set mandatory values
+            invoice.due_date = frappe.utils.nowdate()
+            invoice.update_stock = 1
+            invoice.is_pos = 1
 
-        # Collect unique (account_head, rate) pairs from Item Tax Templates
-        tax_map = set()
+            # Collect unique (account_head, rate) pairs from Item Tax Templates
+            tax_map = set()
         
-        for row in invoice.items:
-            item_tax_template = row.item_tax_template = frappe.get_value("Item Tax", {
-                "parent": row.item_code,
-            }, "item_tax_template") or "الضريبة القياسية %15 - ذهول"
-            row.item_tax_template = item_tax_template 
+            # item -> (template, taxes) for every row, warm in redis or loaded in one go
+            with phase("taxes"):
+                tax_index = get_item_tax_index(row.item_code for row in invoice.items)
 
-            if item_tax_template:
-                taxes = frappe.get_all(
-                    "Item Tax Template Detail",
-                    filters={"parent": item_tax_template},
-                    fields=["tax_type", "tax_rate"],
-                )
-                for t in taxes:
-                    tax_map.add((t.tax_type, float(t.tax_rate)))
+            for row in invoice.items:
+                item_tax_template, taxes = tax_index[row.item_code]
+                row.item_tax_template = item_tax_template
 
-        # Add unique tax rows to invoice
-        for tax_type, tax_rate in tax_map:
-            invoice.append("taxes", {
-                "charge_type": "On Net Total",
-                "account_head": tax_type,
-                "rate": tax_rate,
-                "description": tax_type,
-            })
+                for tax_type, tax_rate in taxes:
+                    tax_map.add((tax_type, float(tax_rate)))
 
-        invoice.set_missing_values()
-        invoice.calculate_taxes_and_totals()
+            # Add unique tax rows to invoice
+            for tax_type, tax_rate in tax_map:
+                invoice.append("taxes", {
+                    "charge_type": "On Net Total",
+                    "account_head": tax_type,
+                    "rate": tax_rate,
+                    "description": tax_type,
+                })
 
-        mode_of_payment = sales_order.custom_mode_of_payment
-        account = frappe.get_value('Mode of Payment Account', {
-            "parent": mode_of_payment,
-            "company": sales_order.company,
-        }, "default_account")
+            invoice.set_missing_values()
+            invoice.calculate_taxes_and_totals()
 
-        if mode_of_payment:
-            invoice.append("payments", {
-                "mode_of_payment": mode_of_payment,
-                "account": account,
-                "amount": max(invoice.grand_total or 0, invoice.rounded_total or 0)
-            })
+            mode_of_payment = sales_order.custom_mode_of_payment
+            account = frappe.get_value('Mode of Payment Account', {
+                "parent": mode_of_payment,
+                "company": sales_order.company,
+            }, "default_account")
+
+            if mode_of_payment:
+                invoice.append("payments", {
+                    "mode_of_payment": mode_of_payment,
+                    "account": account,
+                    "amount": max(invoice.grand_total or 0, invoice.rounded_total or 0)
+                })
         
-        invoice.ignore_permissions = True
-        invoice.insert()
+            invoice.ignore_permissions = True
+            invoice.insert()
+
+            return invoice
 
-    except Exception as e:
-        frappe.log_error(frappe.get_traceback(), "Auto Create Sales Invoice Error")
\ No newline at end of file
+        except Exception as e:
+            frappe.db.rollback(save_point="sales_invoice")
+            frappe.log_error(frappe.get_traceback(), "Auto Create Sales Invoice Error")
\ No newline at end of file
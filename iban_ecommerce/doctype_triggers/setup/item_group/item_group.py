@@ -0,0 +1,24 @@
+import frappe
+
+from iban_ecommerce.utils.master_data import clear_new_master
+from iban_ecommerce.utils.master_data_cache import clear_master_data_cache
+
+
+@frappe.whitelist()
+def after_insert(doc, method=None):
+    # Drop cached misses for the keys this new record now answers
+    clear_new_master(doc)
+
+@frappe.whitelist()
+def on_update(doc, method=None):
+    # Inserts are handled by after_insert, updates may change any lookup field
+    if not doc.flags.in_insert:
+        clear_master_data_cache(doc.doctype)
+
+@frappe.whitelist()
+def after_rename(doc, method=None, old=None, new=None, merge=False):
+    clear_master_data_cache(doc.doctype)
+
+@frappe.whitelist()
+def on_trash(doc, method=None):
+    clear_master_data_cache(doc.doctype)
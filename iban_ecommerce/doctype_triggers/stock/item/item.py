@@ -0,0 +1,30 @@
+import frappe
+
+from iban_ecommerce.utils.item_tax import clear_item_tax_cache
+from iban_ecommerce.utils.master_data import clear_new_master
+from iban_ecommerce.utils.master_data_cache import clear_master_data_cache
+
+
+@frappe.whitelist()
+def after_insert(doc, method=None):
+    # Drop cached misses for the keys this new record now answers
+    clear_new_master(doc)
+    clear_item_tax_cache(doc.name)
+
+@frappe.whitelist()
+def on_update(doc, method=None):
+    # Inserts are handled by after_insert, updates may change any lookup field.
+    # Catalog syncs clear the cache themselves once per chunk.
+    if not doc.flags.in_insert and not doc.flags.skip_master_data_cache_clear:
+        clear_master_data_cache(doc.doctype)
+    clear_item_tax_cache(doc.name)
+
+@frappe.whitelist()
+def after_rename(doc, method=None, old=None, new=None, merge=False):
+    clear_master_data_cache(doc.doctype)
+    clear_item_tax_cache(old, new)
+
+@frappe.whitelist()
+def on_trash(doc, method=None):
+    clear_master_data_cache(doc.doctype)
+    clear_item_tax_cache(doc.name)
@@ -83,7 +83,8 @@ app_license = "mit"
 # ------------
 
 # before_install = "iban_ecommerce.install.before_install"
-# after_install = "iban_ecommerce.install.after_install"
+after_install = "iban_ecommerce.install.after_install"
+after_migrate = "iban_ecommerce.install.after_migrate"
 
 # Uninstallation
 # ------------
@@ -164,6 +165,35 @@ doc_events = {
 		"before_cancel": "iban_ecommerce.doctype_triggers.hr.employee_checkin.employee_checkin.before_cancel",
 		"on_update": "iban_ecommerce.doctype_triggers.hr.employee_checkin.employee_checkin.on_update",
 	},
+	"Item": {
+		"after_insert": "iban_ecommerce.doctype_triggers.stock.item.item.after_insert",
+		"on_update": "iban_ecommerce.doctype_triggers.stock.item.item.on_update",
+		"after_rename": "iban_ecommerce.doctype_triggers.stock.item.item.after_rename",
+		"on_trash": "iban_ecommerce.doctype_triggers.stock.item.item.on_trash",
+	},
+	"Customer": {
+		"after_insert": "iban_ecommerce.doctype_triggers.selling.customer.customer.after_insert",
+		"on_update": "iban_ecommerce.doctype_triggers.selling.customer.customer.on_update",
+		"after_rename": "iban_ecommerce.doctype_triggers.selling.customer.customer.after_rename",
+		"on_trash": "iban_ecommerce.doctype_triggers.selling.customer.customer.on_trash",
+	},
+	"Warehouse": {
+		"after_insert": "iban_ecommerce.doctype_triggers.stock.warehouse.warehouse.after_insert",
+		"on_update": "iban_ecommerce.doctype_triggers.stock.warehouse.warehouse.on_update",
+		"after_rename": "iban_ecommerce.doctype_triggers.stock.warehouse.warehouse.after_rename",
+		"on_trash": "iban_ecommerce.doctype_triggers.stock.warehouse.warehouse.on_trash",
+	},
+	"Item Group": {
+		"after_insert": "iban_ecommerce.doctype_triggers.setup.item_group.item_group.after_insert",
+		"on_update": "iban_ecommerce.doctype_triggers.setup.item_group.item_group.on_update",
+		"after_rename": "iban_ecommerce.doctype_triggers.setup.item_group.item_group.after_rename",
+		"on_trash": "iban_ecommerce.doctype_triggers.setup.item_group.item_group.on_trash",
+	},
+	"Item Tax Template": {
+		"on_update": "iban_ecommerce.doctype_triggers.accounts.item_tax_template.item_tax_template.on_update",
+		"after_rename": "iban_ecommerce.doctype_triggers.accounts.item_tax_template.item_tax_template.after_rename",
+		"on_trash": "iban_ecommerce.doctype_triggers.accounts.item_tax_template.item_tax_template.on_trash",
+	},
 }
 
 doctype_js = {
@@ -174,23 +204,18 @@ doctype_js = {
 # Scheduled Tasks
 # ---------------
 
-# scheduler_events = {
-# 	"all": [
-# 		"iban_ecommerce.tasks.all"
-# 	],
-# 	"daily": [
-# 		"iban_ecommerce.tasks.daily"
-# 	],
-# 	"hourly": [
-# 		"iban_ecommerce.tasks.hourly"
-# 	],
-# 	"weekly": [
-# 		"iban_ecommerce.tasks.weekly"
-# 	],
-# 	"monthly": [
-# 		"iban_ecommerce.tasks.monthly"
-# 	],
-# }
+scheduler_events = {
+	"cron": {
+		# Re-invoice submitted orders whose invoice failed
+		"*/15 * * * *": [
+			"iban_ecommerce.tasks.invoice_sweep.sweep_missing_invoices"
+		],
+		# Deferred checkin IN / OUT: retry failed days and pick up missed marks
+		"*/5 * * * *": [
+			"iban_ecommerce.tasks.checkin_log_type.requeue_stale_checkin_days"
+		],
+	},
+}
 
 # Testing
 # -------
@@ -264,7 +289,7 @@ doctype_js = {
 # Automatically update python controller files with type annotations for this app.
 # export_python_type_annotations = True
 
-# default_log_clearing_doctypes = {
-# 	"Logging DocType Name": 30  # days to retain logs
-# }
+default_log_clearing_doctypes = {
+	"Ecommerce Request Profile": 7  # days to retain request profiles
+}
 
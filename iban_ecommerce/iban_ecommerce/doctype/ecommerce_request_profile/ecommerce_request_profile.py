@@ -0,0 +1,32 @@
+# Copyright (c) 2026, Ismail Akram and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.query_builder import Interval
+from frappe.query_builder.functions import Now
+
+from iban_ecommerce.utils.profiler import decompress
+
+
+class EcommerceRequestProfile(Document):
+    @staticmethod
+    def clear_old_logs(days=7):
+        # Retention, called by the log clearing job (default_log_clearing_doctypes)
+        table = frappe.qb.DocType("Ecommerce Request Profile")
+        frappe.db.delete(table, filters=(table.creation < (Now() - Interval(days=days))))
+
+
+@frappe.whitelist()
+def download_profile(name, format="prof"):
+    # The .prof file (snakeviz, flameprof, py-spy ...) or the SQL statements as JSON
+    frappe.only_for("System Manager")
+    doc = frappe.get_doc("Ecommerce Request Profile", name)
+
+    if format == "sql":
+        frappe.response.filecontent = decompress(doc.sql_data)
+        frappe.response.filename = f"{doc.endpoint}-{doc.name}-sql.json"
+    else:
+        frappe.response.filecontent = decompress(doc.profile_data)
+        frappe.response.filename = f"{doc.endpoint}-{doc.name}.prof"
+    frappe.response.type = "download"
@@ -0,0 +1,56 @@
+import frappe
+from frappe.custom.doctype.custom_field.custom_field import create_custom_fields
+
+CUSTOM_FIELDS = {
+    "Sales Order": [
+        {
+            "fieldname": "custom_mode_of_payment",
+            "label": "Mode of Payment",
+            "fieldtype": "Link",
+            "options": "Mode of Payment",
+            "insert_after": "payment_terms_template",
+            "reqd": 0,
+            "hidden": 1,
+        },
+        {
+            "fieldname": "custom_shipping_company",
+            "label": "Shipping Company",
+            "fieldtype": "Link",
+            "options": "Shipping Company",
+            "insert_after": "payment_terms_template",
+            "reqd": 0,
+            "hidden": 1,
+        },
+        {
+            "fieldname": "custom_shipping_amount",
+            "label": "Shipping Amount",
+            "fieldtype": "Float",
+            "insert_after": "payment_terms_template",
+            "reqd": 0,
+            "hidden": 1,
+        },
+        {
+            "fieldname": "custom_idempotency_key",
+            "label": "Idempotency Key",
+            "fieldtype": "Data",
+            "insert_after": "po_no",
+            "read_only": 1,
+            "no_copy": 1,
+            "search_index": 1,
+            "hidden": 1,
+        },
+    ],
+}
+
+
+def after_install():
+    make_custom_fields()
+
+
+def after_migrate():
+    make_custom_fields()
+
+
+def make_custom_fields():
+    # Create or update every custom field this app relies on
+    create_custom_fields(CUSTOM_FIELDS, ignore_validate=True, update=True)
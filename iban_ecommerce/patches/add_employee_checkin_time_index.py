@@ -0,0 +1,6 @@
+import frappe
+
+
+def execute():
+    # IN / OUT maintenance looks checkins up by employee and time range
+    frappe.db.add_index("Employee Checkin", ["employee", "time"], index_name="employee_time_index")
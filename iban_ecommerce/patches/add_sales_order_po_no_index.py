@@ -0,0 +1,6 @@
+import frappe
+
+
+def execute():
+    # Every ecommerce API looks Sales Orders up by the storefront order id
+    frappe.db.add_index("Sales Order", ["po_no"], index_name="po_no_index")
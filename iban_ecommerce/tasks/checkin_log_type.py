@@ -0,0 +1,62 @@
+import frappe
+
+from iban_ecommerce.doctype_triggers.hr.employee_checkin.employee_checkin import recompute_log_type
+from iban_ecommerce.utils.checkin_log_type import (
+    DIRTY_DAYS_KEY,
+    PROCESSING_DAYS_KEY,
+    enqueue_processing,
+    parse_member,
+)
+
+# Employee-days recomputed per commit
+PROCESS_BATCH_SIZE = 200
+
+
+def process_dirty_checkin_days():
+    # Background job: recompute IN / OUT once per dirty employee-day, however many
+    # punches marked it. Returns the number of days recomputed.
+    cache = frappe.cache()
+    dirty = cache.make_key(DIRTY_DAYS_KEY)
+    processing = cache.make_key(PROCESSING_DAYS_KEY)
+    recomputed = 0
+
+    while True:
+        members = cache.srandmember(dirty, PROCESS_BATCH_SIZE)
+        if not members:
+            return recomputed
+
+        done = []
+        for member in members:
+            # A day marked again while we work on it stays in the dirty set and runs again
+            if not cache.smove(dirty, processing, member):
+                continue
+
+            frappe.db.savepoint("checkin_log_type")
+            try:
+                recompute_log_type(*parse_member(member))
+                done.append(member)
+            except Exception:
+                # Left in the processing set, requeue_stale_checkin_days retries it
+                frappe.db.rollback(save_point="checkin_log_type")
+                frappe.log_error(frappe.get_traceback(), "Checkin log type recompute failed")
+
+        frappe.db.commit()
+        if done:
+            cache.srem(processing, *done)
+            recomputed += len(done)
+
+
+def requeue_stale_checkin_days():
+    # Scheduled safety net: days of a job that died or failed go back to the dirty
+    # set, and a job is queued if anything is waiting. Recomputing a day twice is harmless.
+    cache = frappe.cache()
+    dirty = cache.make_key(DIRTY_DAYS_KEY)
+    processing = cache.make_key(PROCESSING_DAYS_KEY)
+
+    pipeline = cache.pipeline()
+    pipeline.sunionstore(dirty, dirty, processing)
+    pipeline.delete(processing)
+    pending = pipeline.execute()[0]
+
+    if pending:
+        enqueue_processing()
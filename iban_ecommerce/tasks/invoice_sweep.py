@@ -0,0 +1,150 @@
+import hashlib
+import json
+
+import frappe
+from frappe.utils import add_to_date, now_datetime
+
+from iban_ecommerce.apis.selling.sales_order.sales_order import (
+    get_order_job_status_record,
+    get_order_queue,
+    submit_and_invoice,
+)
+
+# Last (modified, name) scanned, stored with frappe.db.set_global
+CHECKPOINT_KEY = "iban_ecommerce_invoice_sweep_checkpoint"
+
+# Redis hash with the outcome of the latest run, and the set of orders it could not repair
+REPORT_KEY = "iban_ecommerce:invoice_sweep_report"
+FAILED_ORDERS_KEY = "iban_ecommerce:invoice_sweep_failed_orders"
+
+# Orders touched more recently may still have their invoice job running
+SWEEP_GRACE_MINUTES = 30
+
+# Orders repaired per background job, and orders picked up per run
+SWEEP_BATCH_SIZE = 50
+MAX_SWEEP_ORDERS = 2000
+
+
+def sweep_missing_invoices():
+    # Scheduled: find submitted ecommerce orders without an invoice since the last
+    # run and queue their repair in bounded batches
+    cutoff = add_to_date(now_datetime(), minutes=-SWEEP_GRACE_MINUTES)
+    after = json.loads(frappe.db.get_global(CHECKPOINT_KEY) or "null")
+    orders = get_orders_without_invoice(after, cutoff, MAX_SWEEP_ORDERS)
+
+    # A full page leaves the rest for the next run, otherwise everything up to the cutoff is done
+    if len(orders) >= MAX_SWEEP_ORDERS:
+        checkpoint = [str(orders[-1].modified), orders[-1].name]
+    else:
+        checkpoint = [str(cutoff), ""]
+
+    # Orders the previous run could not repair are behind the checkpoint, retry them too
+    names = list(dict.fromkeys([order.name for order in orders] + get_failed_orders()))
+    for start in range(0, len(names), SWEEP_BATCH_SIZE):
+        batch = names[start:start + SWEEP_BATCH_SIZE]
+        frappe.enqueue(
+            "iban_ecommerce.tasks.invoice_sweep.repair_missing_invoices",
+            queue=get_order_queue(),
+            # Named after every order it holds, only the very same batch still queued is skipped
+            job_id=f"iban_ecommerce::repair_missing_invoices::{hashlib.sha1('|'.join(batch).encode()).hexdigest()}",
+            deduplicate=True,
+            enqueue_after_commit=True,
+            sales_orders=batch,
+        )
+
+    frappe.db.set_global(CHECKPOINT_KEY, json.dumps(checkpoint))
+    set_report({
+        "run_at": str(now_datetime()),
+        "scanned_until": checkpoint[0],
+        "found": len(names),
+        "repaired": 0,
+        "failed": 0,
+    })
+    frappe.db.commit()
+
+
+def get_orders_without_invoice(after, cutoff, limit):
+    # One anti-join over Sales Invoice Item.sales_order, keyset paged on (modified, name).
+    # A cancelled invoice counts as one, cancelling it was a decision and not a failure.
+    conditions = ""
+    if after:
+        conditions = "AND so.modified >= %(modified)s AND (so.modified > %(modified)s OR so.name > %(name)s)"
+
+    return frappe.db.sql(f"""
+        SELECT so.name, so.modified
+        FROM `tabSales Order` so
+        LEFT JOIN `tabSales Invoice Item` sii
+            ON sii.sales_order = so.name
+        WHERE
+            so.docstatus = 1
+            AND so.status != 'Closed'
+            AND COALESCE(so.po_no, '') != ''
+            AND so.modified <= %(cutoff)s
+            {conditions}
+            AND sii.name IS NULL
+        ORDER BY so.modified ASC, so.name ASC
+        LIMIT {int(limit)}
+    """, {
+        "cutoff": cutoff,
+        "modified": after and after[0],
+        "name": after and after[1],
+    }, as_dict=True)
+
+
+def repair_missing_invoices(sales_orders):
+    # Background job: invoice each order through the regular submit and invoice job,
+    # which commits per order and records its status
+    repaired = []
+    failed = []
+    invoiced = []
+    for sales_order in sales_orders:
+        if frappe.db.exists("Sales Invoice Item", {"sales_order": sales_order}):
+            invoiced.append(sales_order)
+            continue
+
+        submit_and_invoice(sales_order)
+        job = get_order_job_status_record(sales_order) or {}
+        (repaired if job.get("status") == "completed" else failed).append(sales_order)
+
+    update_report(repaired, failed, invoiced)
+    frappe.logger("iban_ecommerce").info(
+        f"Invoice sweep repaired {len(repaired)} order(s), failed {len(failed)}: {', '.join(failed)}"
+    )
+
+
+def set_report(values):
+    # Failed orders are kept, they leave the set only once an invoice exists
+    cache = frappe.cache()
+    pipeline = cache.pipeline()
+    pipeline.delete(cache.make_key(REPORT_KEY))
+    pipeline.hset(cache.make_key(REPORT_KEY), mapping=values)
+    pipeline.execute()
+
+
+def update_report(repaired, failed, invoiced=()):
+    # Batches of one run finish in any order, counters are incremented atomically
+    cache = frappe.cache()
+    pipeline = cache.pipeline()
+    pipeline.hincrby(cache.make_key(REPORT_KEY), "repaired", len(repaired))
+    pipeline.hincrby(cache.make_key(REPORT_KEY), "failed", len(failed))
+    if repaired or invoiced:
+        pipeline.srem(cache.make_key(FAILED_ORDERS_KEY), *repaired, *invoiced)
+    if failed:
+        pipeline.sadd(cache.make_key(FAILED_ORDERS_KEY), *failed)
+    pipeline.execute()
+
+
+def get_failed_orders():
+    cache = frappe.cache()
+    return sorted(name.decode() for name in cache.smembers(cache.make_key(FAILED_ORDERS_KEY)))
+
+
+@frappe.whitelist()
+def get_invoice_sweep_report():
+    frappe.only_for("System Manager")
+    cache = frappe.cache()
+    pipeline = cache.pipeline()
+    pipeline.hgetall(cache.make_key(REPORT_KEY))
+    report = {key.decode(): value.decode() for key, value in pipeline.execute()[0].items()}
+    report["failed_orders"] = get_failed_orders()
+    return report
@@ -0,0 +1,179 @@
+# Query budgets of the whitelisted APIs, run with:
+#
+#   bench --site test_site run-tests --app iban_ecommerce
+#
+# Every statement issued through frappe.db.sql and every commit is counted per
+# phase (see iban_ecommerce.utils.metrics). The phases owned by this app must
+# not grow with the number of order lines; whole calls, which include ERPNext's
+# own per-row work, must stay within a base plus a per-line allowance.
+
+from contextlib import contextmanager
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import nowdate
+
+from iban_ecommerce.apis.accounts.payment_entry.payment_entry import create_payment_entry
+from iban_ecommerce.apis.selling.sales_order.sales_order import (
+    cancel_sales_order,
+    create_sales_order,
+    create_sales_orders_bulk,
+    get_sales_order_invoice,
+)
+from iban_ecommerce.benchmarks.seed import seed_catalog
+from iban_ecommerce.doctype_triggers.selling.sales_order.sales_order import create_sales_invoice
+from iban_ecommerce.utils.master_data_cache import clear_master_data_cache
+from iban_ecommerce.utils.metrics import Recorder
+
+# Statements allowed for the phases this app owns, whatever the order size
+VALIDATION_BUDGET = 2
+RESOLUTION_BUDGET = 2
+BULK_RESOLUTION_BUDGET = 5
+INVOICE_TAX_BUDGET = 2
+
+# Whole create_sales_order call: base plus an allowance per line for ERPNext's own work
+ORDER_BASE_BUDGET = 150
+ORDER_PER_LINE_BUDGET = 25
+
+SMALL_ORDER_LINES = 1
+LARGE_ORDER_LINES = 50
+
+
+@contextmanager
+def count_queries():
+    # Count statements and commits of everything run inside the block, per phase
+    recorder = frappe.local.iban_ecommerce_recorder = Recorder("query_budget")
+    recorder.start()
+    try:
+        yield recorder
+    finally:
+        recorder.stop()
+        frappe.local.iban_ecommerce_recorder = None
+
+
+def queries(recorder, phase="total"):
+    return recorder.stats.get(phase, [0, 0, 0, 0])[1]
+
+
+def commits(recorder, phase="total"):
+    return recorder.stats.get(phase, [0, 0, 0, 0])[3]
+
+
+def set_request(payload, headers=None):
+    frappe.local.request = frappe._dict(get_json=lambda: payload, headers=headers or {})
+
+
+class TestQueryBudget(FrappeTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.catalog = seed_catalog(customers=2, items=LARGE_ORDER_LINES, prefix="QB")
+
+    def setUp(self):
+        # Budgets are asserted on a cold resolution cache
+        for doctype in ("Customer", "Warehouse", "Item Group", "Item"):
+            clear_master_data_cache(doctype)
+
+    def tearDown(self):
+        frappe.local.request = None
+
+    def make_order(self, lines, **extra):
+        return {
+            "po_no": f"QB-{frappe.generate_hash(length=12)}",
+            "customer": self.catalog["customers"][0],
+            "set_warehouse": self.catalog["warehouse"],
+            "transaction_date": nowdate(),
+            "delivery_date": nowdate(),
+            "custom_mode_of_payment": self.catalog["mode_of_payment"],
+            "items": [
+                {"item_code": item_code, "qty": 1, "rate": 100}
+                for item_code in self.catalog["items"][:lines]
+            ],
+            **extra,
+        }
+
+    def create_order(self, lines, **extra):
+        order = self.make_order(lines, **extra)
+        set_request(order)
+        with count_queries() as recorder:
+            so = create_sales_order()
+        return so, recorder
+
+    def submit_invoice(self, sales_order):
+        # The invoice job leaves a draft POS invoice, submit it as a credit sale so it can be paid
+        invoice = frappe.get_doc("Sales Invoice", get_sales_order_invoice(sales_order))
+        invoice.is_pos = 0
+        invoice.payments = []
+        invoice.save()
+        invoice.submit()
+        return invoice
+
+    def test_create_sales_order_budget(self):
+        _, small = self.create_order(SMALL_ORDER_LINES)
+        self.setUp()
+        _, large = self.create_order(LARGE_ORDER_LINES)
+
+        for recorder in (small, large):
+            self.assertLessEqual(queries(recorder, "validation"), VALIDATION_BUDGET)
+            self.assertLessEqual(queries(recorder, "resolution"), RESOLUTION_BUDGET)
+            self.assertEqual(commits(recorder), 1)
+
+        self.assertEqual(queries(small, "resolution"), queries(large, "resolution"))
+        self.assertLessEqual(queries(large), ORDER_BASE_BUDGET + ORDER_PER_LINE_BUDGET * LARGE_ORDER_LINES)
+
+    def test_warm_cache_resolution_is_free(self):
+        self.create_order(LARGE_ORDER_LINES)
+        _, warm = self.create_order(LARGE_ORDER_LINES)
+        self.assertEqual(queries(warm, "resolution"), 0)
+
+    def test_create_sales_orders_bulk_budget(self):
+        def run(count):
+            self.setUp()
+            set_request({"orders": [self.make_order(5) for _ in range(count)]})
+            with count_queries() as recorder:
+                result = create_sales_orders_bulk()
+            self.assertEqual(result["failed"], 0)
+            return recorder
+
+        few, many = run(2), run(20)
+        for recorder in (few, many):
+            self.assertLessEqual(queries(recorder, "validation"), VALIDATION_BUDGET)
+            self.assertLessEqual(queries(recorder, "resolution"), BULK_RESOLUTION_BUDGET)
+        self.assertEqual(queries(few, "resolution"), queries(many, "resolution"))
+
+    def test_create_sales_invoice_tax_budget(self):
+        def run(lines):
+            so, _ = self.create_order(lines)
+            so_doc = frappe.get_doc("Sales Order", so["name"])
+            so_doc.submit()
+            with count_queries() as recorder:
+                create_sales_invoice(so_doc)
+            return recorder
+
+        small, large = run(SMALL_ORDER_LINES), run(LARGE_ORDER_LINES)
+        for recorder in (small, large):
+            self.assertLessEqual(queries(recorder, "taxes"), INVOICE_TAX_BUDGET)
+        self.assertEqual(queries(small, "taxes"), queries(large, "taxes"))
+
+    def test_payment_and_cancel_budget(self):
+        def run(lines):
+            so, _ = self.create_order(lines, is_submittable=1, is_async=0)
+            self.submit_invoice(so["name"])
+
+            set_request({"order_id": so["po_no"], "mode_of_payment": self.catalog["mode_of_payment"]})
+            with count_queries() as payment:
+                result = create_payment_entry()
+            self.assertEqual(result.get("status"), "Success", result)
+
+            with count_queries() as cancel:
+                result = cancel_sales_order(so["po_no"])
+            self.assertEqual(result["status"], "Success", result)
+            self.assertEqual(commits(cancel), 1)
+            return payment, cancel
+
+        small_payment, small_cancel = run(SMALL_ORDER_LINES)
+        large_payment, large_cancel = run(LARGE_ORDER_LINES)
+
+        self.assertLessEqual(queries(large_payment, "resolution"), RESOLUTION_BUDGET)
+        self.assertEqual(queries(small_payment, "resolution"), queries(large_payment, "resolution"))
+        self.assertEqual(queries(small_cancel, "resolution"), queries(large_cancel, "resolution"))
@@ -0,0 +1,54 @@
+# Behaviour of the Sales Order APIs, run with:
+#
+#   bench --site test_site run-tests --app iban_ecommerce
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import nowdate
+
+from iban_ecommerce.apis.selling.sales_order.sales_order import create_sales_orders_bulk
+from iban_ecommerce.benchmarks.seed import seed_catalog
+
+
+def set_request(payload, headers=None):
+    frappe.local.request = frappe._dict(get_json=lambda: payload, headers=headers or {})
+
+
+class TestSalesOrderAPI(FrappeTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.catalog = seed_catalog(customers=1, items=2, prefix="SOT")
+
+    def tearDown(self):
+        frappe.local.request = None
+
+    def make_order(self, **extra):
+        return {
+            "po_no": f"SOT-{frappe.generate_hash(length=12)}",
+            "customer": self.catalog["customers"][0],
+            "set_warehouse": self.catalog["warehouse"],
+            "transaction_date": nowdate(),
+            "delivery_date": nowdate(),
+            "custom_mode_of_payment": self.catalog["mode_of_payment"],
+            "items": [{"item_code": self.catalog["items"][0], "qty": 1, "rate": 100}],
+            **extra,
+        }
+
+    def test_bulk_repeats_are_created_once(self):
+        first = self.make_order(idempotency_key=frappe.generate_hash(length=16))
+        same_po_no = self.make_order(po_no=first["po_no"].lower())
+        same_key = self.make_order(idempotency_key=first["idempotency_key"].upper())
+        other = self.make_order()
+
+        set_request({"orders": [first, same_po_no, same_key, other]})
+        results = create_sales_orders_bulk()["results"]
+
+        self.assertEqual([result["status"] for result in results], ["success"] * 4)
+        sales_order = results[0]["sales_order"]
+        for result in results[1:3]:
+            self.assertTrue(result["duplicate"])
+            self.assertEqual(result["duplicate_of"], 0)
+            self.assertEqual(result["sales_order"], sales_order)
+        self.assertNotEqual(results[3]["sales_order"], sales_order)
+        self.assertEqual(frappe.db.count("Sales Order", {"po_no": first["po_no"]}), 1)
@@ -0,0 +1,58 @@
+import frappe
+from frappe.utils import getdate
+
+from iban_ecommerce.utils.locks import acquire_lock, get_lock_name, hold_until_transaction_end
+
+# Site config "iban_ecommerce_checkin_log_type_mode": "sync" (default) updates IN / OUT
+# inside every checkin insert, "deferred" only marks the employee-day dirty and a
+# background job recomputes each dirty day once.
+SYNC_MODE = "sync"
+DEFERRED_MODE = "deferred"
+
+# Redis sets of "employee|YYYY-MM-DD" members: waiting, and taken by a running job
+DIRTY_DAYS_KEY = "iban_ecommerce:checkin_dirty_days"
+PROCESSING_DAYS_KEY = "iban_ecommerce:checkin_processing_days"
+
+PROCESS_JOB_ID = "iban_ecommerce::process_dirty_checkin_days"
+
+
+def use_deferred_log_type():
+    return frappe.conf.get("iban_ecommerce_checkin_log_type_mode", SYNC_MODE) == DEFERRED_MODE
+
+
+def lock_checkin_day(employee, day):
+    # Serialize IN / OUT updates of one employee-day until this transaction ends,
+    # two punches of the same day would otherwise both see themselves as the last
+    name = get_lock_name("Employee Checkin", employee, getdate(day))
+    acquire_lock(name)
+    hold_until_transaction_end(name)
+
+
+def mark_days_dirty(days):
+    # Queue (employee, day) pairs for a recompute once this transaction commits,
+    # a rolled back insert leaves nothing to recompute
+    members = {f"{employee}|{getdate(day)}" for employee, day in days}
+    if not members:
+        return
+
+    def mark():
+        cache = frappe.cache()
+        cache.sadd(cache.make_key(DIRTY_DAYS_KEY), *members)
+        enqueue_processing()
+
+    frappe.db.after_commit.add(mark)
+
+
+def enqueue_processing():
+    # One job drains the whole set, marks made while it waits in the queue join it
+    frappe.enqueue(
+        "iban_ecommerce.tasks.checkin_log_type.process_dirty_checkin_days",
+        queue="short",
+        job_id=PROCESS_JOB_ID,
+        deduplicate=True,
+    )
+
+
+def parse_member(member):
+    employee, day = member.decode().rsplit("|", 1)
+    return employee, getdate(day)
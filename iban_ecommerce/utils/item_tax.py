@@ -0,0 +1,111 @@
+import json
+
+import frappe
+from frappe.utils import flt
+
+from iban_ecommerce.utils.master_data import DEFAULT_ITEM_TAX_TEMPLATE
+
+# Redis hashes: item -> item tax template ("" when the item has none)
+# and item tax template -> JSON list of [tax_type, tax_rate]
+ITEM_TEMPLATES_KEY = "iban_ecommerce:item_tax_templates"
+TEMPLATE_TAXES_KEY = "iban_ecommerce:item_tax_template_taxes"
+
+
+def get_item_tax_index(item_codes):
+    # {item_code: (item tax template, [(tax_type, tax_rate), ...])}, items without
+    # a template of their own fall back to the default template
+    item_codes = set(item_codes)
+    templates = {
+        item_code: template or DEFAULT_ITEM_TAX_TEMPLATE
+        for item_code, template in get_item_templates(item_codes).items()
+    }
+    taxes = get_template_taxes(set(templates.values()))
+    return {item_code: (template, taxes.get(template, [])) for item_code, template in templates.items()}
+
+
+def get_item_templates(item_codes):
+    templates = get_cached("item", ITEM_TEMPLATES_KEY, item_codes)
+    misses = [item_code for item_code in item_codes if item_code not in templates]
+    if not misses:
+        return templates
+
+    found = {}
+    for row in frappe.db.sql("""
+        SELECT parent, item_tax_template
+        FROM `tabItem Tax`
+        WHERE
+            parenttype = 'Item'
+            AND parent IN %(items)s
+        ORDER BY idx ASC
+    """, {"items": tuple(misses)}, as_dict=True):
+        found.setdefault(row.parent, row.item_tax_template or "")
+
+    found = {item_code: found.get(item_code, "") for item_code in misses}
+    set_cached(ITEM_TEMPLATES_KEY, found)
+    templates.update(found)
+    return templates
+
+
+def get_template_taxes(templates):
+    taxes = get_cached("template", TEMPLATE_TAXES_KEY, templates)
+    misses = [template for template in templates if template not in taxes]
+    if not misses:
+        return taxes
+
+    found = {template: [] for template in misses}
+    for row in frappe.db.sql("""
+        SELECT parent, tax_type, tax_rate
+        FROM `tabItem Tax Template Detail`
+        WHERE parent IN %(templates)s
+        ORDER BY idx ASC
+    """, {"templates": tuple(misses)}, as_dict=True):
+        found[row.parent].append((row.tax_type, flt(row.tax_rate)))
+
+    set_cached(TEMPLATE_TAXES_KEY, found)
+    taxes.update(found)
+    return taxes
+
+
+def get_cached(kind, key, fields):
+    fields = list(fields)
+    if not fields:
+        return {}
+
+    cache = frappe.cache()
+    values = cache.hmget(cache.make_key(key), fields)
+    cached = {}
+    for field, value in zip(fields, values, strict=True):
+        if value is None:
+            continue
+        value = value.decode()
+        cached[field] = [tuple(tax) for tax in json.loads(value)] if kind == "template" else value
+    return cached
+
+
+def set_cached(key, values):
+    if not values:
+        return
+
+    cache = frappe.cache()
+    pipeline = cache.pipeline()
+    pipeline.hset(
+        cache.make_key(key),
+        mapping={field: value if isinstance(value, str) else json.dumps(value) for field, value in values.items()},
+    )
+    pipeline.execute()
+
+
+def clear_item_tax_cache(*item_codes):
+    # An item's template rows changed
+    cache = frappe.cache()
+    item_codes = [item_code for item_code in item_codes if item_code]
+    if item_codes:
+        pipeline = cache.pipeline()
+        pipeline.hdel(cache.make_key(ITEM_TEMPLATES_KEY), *item_codes)
+        pipeline.execute()
+
+
+def clear_item_tax_template_cache():
+    # A template changed, renamed or deleted, both maps may point at it
+    cache = frappe.cache()
+    cache.delete(cache.make_key(ITEM_TEMPLATES_KEY), cache.make_key(TEMPLATE_TAXES_KEY))
@@ -0,0 +1,45 @@
+import hashlib
+
+import frappe
+from frappe.utils import cstr
+
+# Seconds a request waits for another one working on the same key
+LOCK_TIMEOUT = 10
+
+
+def get_lock_name(*parts):
+    # Advisory lock names are limited to 64 characters, hash the site and key
+    key = "|".join([frappe.local.site, *(cstr(part) for part in parts)])
+    return "iban_ecommerce:" + hashlib.sha1(key.encode()).hexdigest()
+
+
+def acquire_lock(name, timeout=LOCK_TIMEOUT):
+    if frappe.db.db_type == "postgres":
+        # Transaction scoped, released by the commit or rollback itself
+        frappe.db.sql("SELECT pg_advisory_xact_lock(hashtext(%s))", (name,))
+        return
+
+    if not frappe.db.sql("SELECT GET_LOCK(%s, %s)", (name, timeout))[0][0]:
+        frappe.throw(
+            "Another request is working on the same record, please retry",
+            frappe.QueryTimeoutError,
+        )
+
+
+def release_lock(name):
+    if frappe.db.db_type != "postgres":
+        frappe.db.sql("SELECT RELEASE_LOCK(%s)", (name,))
+
+
+def hold_until_transaction_end(name, on_commit=None):
+    # Keep the lock until the work done under it is visible to everyone else.
+    # on_commit runs before the release, so the next holder sees its effects.
+    def committed():
+        try:
+            if on_commit:
+                on_commit()
+        finally:
+            release_lock(name)
+
+    frappe.db.after_commit.add(committed)
+    frappe.db.after_rollback.add(lambda: release_lock(name))
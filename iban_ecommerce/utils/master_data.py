@@ -0,0 +1,226 @@
+from collections import defaultdict
+
+import frappe
+from frappe.utils import cstr
+
+from iban_ecommerce.utils.locks import (
+    acquire_lock,
+    get_lock_name,
+    hold_until_transaction_end,
+    release_lock,
+)
+from iban_ecommerce.utils.master_data_cache import (
+    clear_master_data_keys,
+    get_cached_names,
+    normalize_key,
+    set_cached_names,
+)
+
+DEFAULT_ITEM_GROUP = "اونلاين"
+DEFAULT_ITEM_TAX_TEMPLATE = "الضريبة القياسية %15 - ذهول"
+
+# Fields used to match an external key to an existing document, in priority order
+LOOKUP_FIELDS = {
+    "Customer": ("customer_name", "name"),
+    "Warehouse": ("warehouse_name", "name"),
+    "Item Group": ("item_group_name", "name"),
+    "Item": ("item_code", "name", "item_name", "custom_item_id"),
+}
+
+
+def resolve_name(doctype, key):
+    # Resolve a single external key, None when no document matches
+    if not key:
+        return None
+    return resolve_names(doctype, [key]).get(cstr(key))
+
+
+def resolve_names(doctype, keys):
+    # Map external keys to existing document names. Cached answers (including
+    # misses) are served from the resolution cache, the rest with one IN query.
+    keys = {cstr(key) for key in keys if key}
+    if not keys:
+        return {}
+
+    cached = get_cached_names(doctype, keys)
+    resolved = {key: name for key, name in cached.items() if name}
+    misses = keys - set(cached)
+    if not misses:
+        return resolved
+
+    found = query_names(doctype, misses)
+    set_cached_names(doctype, {key: found.get(key) for key in misses})
+    resolved.update(found)
+    return resolved
+
+
+def query_names(doctype, keys):
+    lookup_fields = LOOKUP_FIELDS[doctype]
+    columns = ", ".join(f"`{field}`" for field in dict.fromkeys(("name", *lookup_fields)))
+    conditions = " OR ".join(f"`{field}` IN %(keys)s" for field in lookup_fields)
+    rows = frappe.db.sql(
+        f"SELECT {columns} FROM `tab{doctype}` WHERE {conditions}",
+        {"keys": tuple(keys)},
+        as_dict=True,
+    )
+
+    # The database compares case-insensitively, so match keys the same way
+    keys_by_fold = defaultdict(list)
+    for key in keys:
+        keys_by_fold[key.casefold()].append(key)
+
+    # Walk the fields in priority order so a key resolves exactly as the
+    # sequential frappe.get_value lookups used to
+    resolved = {}
+    for field in lookup_fields:
+        for row in rows:
+            for key in keys_by_fold.get(cstr(row.get(field)).casefold(), ()):
+                resolved.setdefault(key, row.name)
+    return resolved
+
+
+def clear_new_master(doc):
+    # A new master may answer keys that were cached as misses
+    clear_master_data_keys(doc.doctype, [doc.get(field) for field in LOOKUP_FIELDS[doc.doctype]])
+
+
+def create_customer(customer):
+    customer_doc = frappe.get_doc({
+        "doctype": "Customer",
+        "customer_name": customer,
+        "customer_type": "Individual"
+    })
+    customer_doc.insert(ignore_permissions=True)
+    return customer_doc.name
+
+
+def create_warehouse(warehouse):
+    warehouse_doc = frappe.get_doc({
+        "doctype": "Warehouse",
+        "warehouse_name": warehouse,
+    })
+    warehouse_doc.insert(ignore_permissions=True)
+    return warehouse_doc.name
+
+
+def create_item_group(item_group):
+    item_group_doc = frappe.get_doc({
+        "doctype": "Item Group",
+        "item_group_name": item_group,
+        "parent_item_group": "All Item Groups",
+        "is_group": 0
+    })
+    item_group_doc.insert(ignore_permissions=True)
+    return item_group_doc.name
+
+
+def create_item(item_code, item_group=None, item_name=None, custom_item_id=None, item_tax_template=None):
+    # One insert, the tax row is part of the new document
+    item_doc = frappe.get_doc({
+        "doctype": "Item",
+        "item_code": item_code,
+        "item_name": item_name or item_code,
+        "item_group": item_group or DEFAULT_ITEM_GROUP,
+        "stock_uom": "Nos",
+        "is_stock_item": 1,
+        "custom_item_id": custom_item_id,
+        "taxes": [{"item_tax_template": item_tax_template or DEFAULT_ITEM_TAX_TEMPLATE}],
+    })
+
+    item_doc.insert(ignore_permissions=True)
+    return item_doc.name
+
+
+def get_or_create_name(doctype, key, create):
+    # Contention-safe get-or-create. Requests creating the same key serialize on an
+    # advisory lock held until their transaction ends, other keys never wait.
+    key = cstr(key)
+    name = resolve_name(doctype, key)
+    if name:
+        return name
+
+    lock = get_lock_name(doctype, normalize_key(key))
+    acquire_lock(lock)
+
+    # The previous holder published its new master on commit, our snapshot may not see it yet
+    name = get_cached_names(doctype, [key], local=False).get(key) or query_names(doctype, {key}).get(key)
+    if name:
+        release_lock(lock)
+        return name
+
+    frappe.db.savepoint("get_or_create")
+    try:
+        name = create(key)
+    except frappe.DuplicateEntryError as e:
+        # Same name inserted outside the lock, use the existing document
+        frappe.db.rollback(save_point="get_or_create")
+        frappe.clear_messages()
+        release_lock(lock)
+        if len(e.args) > 1 and e.args[1]:
+            return e.args[1]
+        raise
+    except Exception:
+        release_lock(lock)
+        raise
+
+    hold_until_transaction_end(lock, on_commit=lambda: set_cached_names(doctype, {key: name}))
+    return name
+
+
+CREATORS = {
+    "Customer": create_customer,
+    "Warehouse": create_warehouse,
+    "Item Group": create_item_group,
+}
+
+
+def create_missing(doctype, keys, create=None):
+    # Create each missing master a single time, in key order so concurrent requests
+    # take their locks in the same order. Returns (created, errors) where
+    # errors maps a key to the reason its master could not be created.
+    create = create or CREATORS[doctype]
+    created = {}
+    errors = {}
+
+    for key in sorted(keys):
+        frappe.db.savepoint("create_master")
+        try:
+            created[key] = get_or_create_name(doctype, key, create)
+        except Exception as e:
+            frappe.db.rollback(save_point="create_master")
+            frappe.clear_messages()
+            errors[key] = f"Could not create {doctype} {key}: {e}"
+
+    return created, errors
+
+
+def get_or_create_names(doctype, keys):
+    # Resolve many keys at once and create the ones that do not exist yet
+    resolved = resolve_names(doctype, keys)
+    created, errors = create_missing(doctype, {cstr(key) for key in keys if key} - set(resolved))
+    resolved.update(created)
+    return resolved, errors
+
+
+def get_or_create_items(rows):
+    # Items need their item group, taken from the first row that mentions the item
+    item_groups = {}
+    for row in rows:
+        item_groups.setdefault(cstr(row.get("item_code")), row.get("item_group") or DEFAULT_ITEM_GROUP)
+
+    resolved = resolve_names("Item", item_groups)
+    missing = {code: group for code, group in item_groups.items() if code and code not in resolved}
+    if not missing:
+        return resolved, {}
+
+    groups, group_errors = get_or_create_names("Item Group", set(missing.values()))
+
+    def create(item_code):
+        item_group = missing[item_code]
+        if item_group in group_errors:
+            frappe.throw(group_errors[item_group])
+        return create_item(item_code, groups[item_group])
+
+    created, errors = create_missing("Item", set(missing), create=create)
+    resolved.update(created)
+    return resolved, errors
@@ -0,0 +1,131 @@
+import time
+from collections import OrderedDict
+
+import frappe
+from frappe.utils import cstr
+
+# Resolved names live for hours, misses only briefly so new masters show up quickly
+CACHE_TTL = 6 * 60 * 60
+NEGATIVE_CACHE_TTL = 30
+
+# Entries kept in each worker before the least recently used ones are dropped
+LOCAL_CACHE_SIZE = 20000
+
+_local_cache = OrderedDict()
+
+
+def generation_key(doctype):
+    return f"iban_ecommerce:master_data_generation:{doctype}"
+
+
+def entry_key(doctype, generation, key):
+    return f"iban_ecommerce:master_data:{doctype}:{generation}:{key}"
+
+
+def normalize_key(key):
+    # Lookups are case-insensitive in the database, the cache must agree
+    return cstr(key).casefold()
+
+
+def get_generation(doctype):
+    # The generation token changes whenever cached names of a doctype may be stale.
+    # It is read from redis once per request and remembered on frappe.local.
+    generations = getattr(frappe.local, "master_data_generations", None)
+    if generations is None:
+        generations = frappe.local.master_data_generations = {}
+
+    if doctype not in generations:
+        generation = frappe.cache().get_value(generation_key(doctype))
+        if not generation:
+            generation = frappe.generate_hash(length=10)
+            frappe.cache().set_value(generation_key(doctype), generation)
+        generations[doctype] = generation
+
+    return generations[doctype]
+
+
+def get_cached_names(doctype, keys, local=True):
+    # Returns {key: name} for every cached key, name is None for a cached miss.
+    # local=False skips this worker's entries and asks redis directly.
+    generation = get_generation(doctype)
+    site = frappe.local.site
+    now = time.monotonic()
+    cached = {}
+    remote = []
+
+    for key in keys:
+        local_key = (site, doctype, generation, normalize_key(key))
+        entry = _local_cache.get(local_key) if local else None
+        if entry and entry[1] > now:
+            _local_cache.move_to_end(local_key)
+            cached[key] = entry[0]
+        else:
+            remote.append(key)
+
+    if remote:
+        cache = frappe.cache()
+        values = cache.mget([
+            cache.make_key(entry_key(doctype, generation, normalize_key(key))) for key in remote
+        ])
+        for key, value in zip(remote, values, strict=True):
+            if value is None:
+                continue
+            name = value.decode() or None
+            cached[key] = name
+            remember(site, doctype, generation, key, name, now)
+
+    return cached
+
+
+def set_cached_names(doctype, names):
+    # Store {key: name} pairs, a None name records a negative lookup
+    if not names:
+        return
+
+    generation = get_generation(doctype)
+    site = frappe.local.site
+    now = time.monotonic()
+    cache = frappe.cache()
+    pipeline = cache.pipeline()
+
+    for key, name in names.items():
+        pipeline.set(
+            cache.make_key(entry_key(doctype, generation, normalize_key(key))),
+            name or "",
+            ex=CACHE_TTL if name else NEGATIVE_CACHE_TTL,
+        )
+        remember(site, doctype, generation, key, name, now)
+
+    pipeline.execute()
+
+
+def remember(site, doctype, generation, key, name, now):
+    local_key = (site, doctype, generation, normalize_key(key))
+    _local_cache[local_key] = (name, now + (CACHE_TTL if name else NEGATIVE_CACHE_TTL))
+    _local_cache.move_to_end(local_key)
+    while len(_local_cache) > LOCAL_CACHE_SIZE:
+        _local_cache.popitem(last=False)
+
+
+def clear_master_data_keys(doctype, keys):
+    # Forget the entries of specific keys, used when a new master appears so the
+    # negative lookups cached for it stop hiding it
+    generation = get_generation(doctype)
+    site = frappe.local.site
+    keys = {normalize_key(key) for key in keys if key}
+    if not keys:
+        return
+
+    for key in keys:
+        _local_cache.pop((site, doctype, generation, key), None)
+
+    cache = frappe.cache()
+    cache.delete(*(cache.make_key(entry_key(doctype, generation, key)) for key in keys))
+
+
+def clear_master_data_cache(doctype):
+    # Start a new generation, every worker drops its entries on its next request
+    frappe.cache().set_value(generation_key(doctype), frappe.generate_hash(length=10))
+    generations = getattr(frappe.local, "master_data_generations", None)
+    if generations:
+        generations.pop(doctype, None)
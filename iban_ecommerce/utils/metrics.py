@@ -0,0 +1,207 @@
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import frappe
+
+from iban_ecommerce.utils.profiler import get_profile_trigger, save_profile, start_profiler
+
+# Redis hash holding every counter, fields are "<metric>|<endpoint>|<phase>[|<le>]"
+METRICS_KEY = "iban_ecommerce:metrics"
+
+# Histogram upper bounds, seconds for timings and statements for query counts
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+HISTOGRAMS = {
+    "iban_ecommerce_wall_seconds": ("Wall time per endpoint and phase", TIME_BUCKETS),
+    "iban_ecommerce_db_seconds": ("Time spent in SQL per endpoint and phase", TIME_BUCKETS),
+    "iban_ecommerce_db_queries": ("SQL statements per endpoint and phase", QUERY_BUCKETS),
+}
+COUNTERS = {
+    "iban_ecommerce_db_commits_total": "Commits per endpoint and phase",
+    "iban_ecommerce_errors_total": "Calls that raised an exception",
+}
+
+
+class Recorder:
+    # Collects wall time, query count, SQL time and commits of one call. Every
+    # phase is inclusive: a statement counts for the call and each open phase.
+
+    def __init__(self, endpoint, capture_queries=False):
+        self.endpoint = endpoint
+        self.open_phases = []
+        self.stats = {}
+        self.failed = False
+        self.db = None
+        # (statement, seconds) of every query, only kept for profiled calls
+        self.queries = [] if capture_queries else None
+
+    def start(self):
+        self.db = frappe.db
+        self.started = time.perf_counter()
+        self.open_phases.append("total")
+        self.stats["total"] = [0.0, 0, 0.0, 0]
+        self.patch_db()
+
+    def stop(self):
+        self.restore_db()
+        self.stats["total"][0] = time.perf_counter() - self.started
+
+    def patch_db(self):
+        # Instance attributes shadow the Database methods for this request only
+        db = self.db
+        sql, commit = db.sql, db.commit
+
+        def timed_sql(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return sql(*args, **kwargs)
+            finally:
+                self.add_query(time.perf_counter() - started)
+                if self.queries is not None:
+                    self.queries.append((args[0] if args else kwargs.get("query"), time.perf_counter() - started))
+
+        def counted_commit(*args, **kwargs):
+            self.add_commit()
+            return commit(*args, **kwargs)
+
+        self.saved = {name: db.__dict__.get(name) for name in ("sql", "commit")}
+        db.sql = timed_sql
+        db.commit = counted_commit
+
+    def restore_db(self):
+        for name, value in self.saved.items():
+            if value is None:
+                self.db.__dict__.pop(name, None)
+            else:
+                setattr(self.db, name, value)
+
+    def add_query(self, duration):
+        for phase in self.open_phases:
+            self.stats[phase][1] += 1
+            self.stats[phase][2] += duration
+
+    def add_commit(self):
+        for phase in self.open_phases:
+            self.stats[phase][3] += 1
+
+    @contextmanager
+    def phase(self, name):
+        self.stats.setdefault(name, [0.0, 0, 0.0, 0])
+        self.open_phases.append(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stats[name][0] += time.perf_counter() - started
+            self.open_phases.remove(name)
+
+    def save(self):
+        cache = frappe.cache()
+        key = cache.make_key(METRICS_KEY)
+        pipeline = cache.pipeline()
+
+        for phase, (wall, queries, db_time, commits) in self.stats.items():
+            labels = f"{self.endpoint}|{phase}"
+            for metric, value in (
+                ("iban_ecommerce_wall_seconds", wall),
+                ("iban_ecommerce_db_seconds", db_time),
+                ("iban_ecommerce_db_queries", queries),
+            ):
+                buckets = HISTOGRAMS[metric][1]
+                le = next((str(bound) for bound in buckets if value <= bound), "+Inf")
+                pipeline.hincrby(key, f"{metric}|{labels}|{le}", 1)
+                pipeline.hincrbyfloat(key, f"{metric}_sum|{labels}", value)
+                pipeline.hincrby(key, f"{metric}_count|{labels}", 1)
+            if commits:
+                pipeline.hincrby(key, f"iban_ecommerce_db_commits_total|{labels}", commits)
+
+        if self.failed:
+            pipeline.hincrby(key, f"iban_ecommerce_errors_total|{self.endpoint}|total", 1)
+
+        pipeline.execute()
+
+
+def instrument(endpoint):
+    # Record a whitelisted API call, place it under @frappe.whitelist()
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if get_recorder():
+                # Called from another instrumented call, count it as a phase of that one
+                with phase(endpoint):
+                    return fn(*args, **kwargs)
+
+            # Opt-in profiling, one config lookup when it is off
+            trigger = get_profile_trigger()
+            recorder = frappe.local.iban_ecommerce_recorder = Recorder(endpoint, capture_queries=bool(trigger))
+            profiler = start_profiler() if trigger else None
+            recorder.start()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                recorder.failed = True
+                raise
+            finally:
+                recorder.stop()
+                if profiler:
+                    profiler.disable()
+                frappe.local.iban_ecommerce_recorder = None
+                try:
+                    recorder.save()
+                    if profiler:
+                        save_profile(recorder, profiler, trigger)
+                except Exception:
+                    # Metrics must never fail the request they describe
+                    pass
+
+        return wrapper
+
+    return decorator
+
+
+def get_recorder():
+    return getattr(frappe.local, "iban_ecommerce_recorder", None)
+
+
+@contextmanager
+def phase(name):
+    # Attribute the enclosed work to a phase of the running call, no-op outside one
+    recorder = get_recorder()
+    if not recorder:
+        yield
+        return
+    with recorder.phase(name):
+        yield
+
+
+def render_prometheus():
+    cache = frappe.cache()
+    pipeline = cache.pipeline()
+    pipeline.hgetall(cache.make_key(METRICS_KEY))
+    fields = {key.decode(): value.decode() for key, value in pipeline.execute()[0].items()}
+
+    series = {}
+    for field, value in fields.items():
+        metric, endpoint, phase_name, *le = field.split("|")
+        series.setdefault(metric, {}).setdefault((endpoint, phase_name), {})[le[0] if le else None] = value
+
+    lines = []
+    for metric, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+        for (endpoint, phase_name), counts in sorted(series.get(metric, {}).items()):
+            labels = f'endpoint="{endpoint}",phase="{phase_name}"'
+            cumulative = 0
+            for bound in (*map(str, buckets), "+Inf"):
+                cumulative += int(counts.get(bound, 0))
+                lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{metric}_sum{{{labels}}} {series.get(f'{metric}_sum', {}).get((endpoint, phase_name), {}).get(None, 0)}")
+            lines.append(f"{metric}_count{{{labels}}} {series.get(f'{metric}_count', {}).get((endpoint, phase_name), {}).get(None, 0)}")
+
+    for metric, help_text in COUNTERS.items():
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        for (endpoint, phase_name), counts in sorted(series.get(metric, {}).items()):
+            lines.append(f'{metric}{{endpoint="{endpoint}",phase="{phase_name}"}} {counts[None]}')
+
+    return "\n".join(lines) + "\n"
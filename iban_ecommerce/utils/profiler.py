@@ -0,0 +1,87 @@
+import base64
+import cProfile
+import io
+import json
+import marshal
+import pstats
+import random
+import zlib
+
+import frappe
+from frappe.utils import flt
+
+# Header asking for a profile of one request, its value must match the site config
+# "iban_ecommerce_profile_token". "iban_ecommerce_profile_sample_rate" (0 to 1)
+# profiles a share of all calls.
+PROFILE_HEADER = "X-Iban-Ecommerce-Profile"
+
+# Bounds of what one profile keeps
+MAX_PROFILE_QUERIES = 5000
+MAX_QUERY_LENGTH = 2000
+SUMMARY_FUNCTIONS = 40
+
+
+def get_profile_trigger():
+    # "Header" or "Sampling" when this call should be profiled, None otherwise
+    conf = frappe.conf
+    rate = conf.get("iban_ecommerce_profile_sample_rate")
+    if rate and random.random() < flt(rate):
+        return "Sampling"
+
+    token = conf.get("iban_ecommerce_profile_token")
+    request = getattr(frappe.local, "request", None)
+    if token and request and request.headers.get(PROFILE_HEADER) == token:
+        return "Header"
+
+
+def start_profiler():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def save_profile(recorder, profiler, trigger):
+    # Serialize in the request, insert in the background so the caller does not wait on it
+    stats = pstats.Stats(profiler)
+    summary = io.StringIO()
+    stats.stream = summary
+    stats.sort_stats("cumulative").print_stats(SUMMARY_FUNCTIONS)
+
+    wall, query_count, db_time, commits = recorder.stats["total"]
+    queries = [
+        (str(query)[:MAX_QUERY_LENGTH], round(duration, 6))
+        for query, duration in recorder.queries[:MAX_PROFILE_QUERIES]
+    ]
+
+    frappe.enqueue(
+        "iban_ecommerce.utils.profiler.insert_profile",
+        queue="short",
+        profile={
+            "endpoint": recorder.endpoint,
+            "trigger": trigger,
+            "status": "Failed" if recorder.failed else "Success",
+            "user": frappe.session.user,
+            "duration": wall,
+            "db_time": db_time,
+            "query_count": query_count,
+            "commit_count": commits,
+            "phases": json.dumps({phase: values for phase, values in recorder.stats.items()}, indent=1),
+            "summary": summary.getvalue(),
+            # pstats data, the format of a cProfile .prof file
+            "profile_data": compress(marshal.dumps(stats.stats)),
+            "sql_data": compress(json.dumps(queries).encode()),
+        },
+    )
+
+
+def insert_profile(profile):
+    frappe.get_doc({"doctype": "Ecommerce Request Profile", **profile}).insert(ignore_permissions=True)
+    frappe.db.commit()
+
+
+def compress(data):
+    return base64.b64encode(zlib.compress(data, 6)).decode()
+
+
+def decompress(data):
+    return zlib.decompress(base64.b64decode(data))
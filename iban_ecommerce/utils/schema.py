@@ -0,0 +1,82 @@
+import re
+
+# Declarative payload schemas: {field: {"type": ..., "required": bool, ...}}.
+# compile_schema turns one into a validator once, at import time, so a request
+# is checked in a single pass over its payload and every problem is reported.
+#
+# Field options:
+#   type       one of TYPES
+#   required   missing, None and "" are rejected
+#   gt / min   bounds for numbers
+#   min_items  minimum length of a list
+#   items      spec of every element of a list
+#   fields     schema of a nested object
+
+DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+TYPES = {
+    "string": (lambda value: isinstance(value, str), "must be a string"),
+    # External codes may arrive as JSON numbers
+    "code": (lambda value: isinstance(value, str) or (isinstance(value, int) and not isinstance(value, bool)), "must be a string or an integer"),
+    "number": (is_number, "must be a number"),
+    "integer": (lambda value: isinstance(value, int) and not isinstance(value, bool), "must be an integer"),
+    "flag": (lambda value: value in (0, 1) and not isinstance(value, float), "must be 0 or 1"),
+    "date": (lambda value: isinstance(value, str) and bool(DATE_PATTERN.match(value)), "must be a date (YYYY-MM-DD)"),
+    "list": (lambda value: isinstance(value, list), "must be a list"),
+    "object": (lambda value: isinstance(value, dict), "must be an object"),
+}
+
+
+def compile_schema(fields):
+    # Returns validate(data) -> [error, ...], empty when the payload is valid
+    compiled = [(name, spec.get("required", False), compile_field(spec)) for name, spec in fields.items()]
+
+    def validate(data, path="", errors=None):
+        errors = [] if errors is None else errors
+        if not isinstance(data, dict):
+            errors.append(f"{path or 'Payload'} must be an object")
+            return errors
+
+        for name, required, check in compiled:
+            value = data.get(name)
+            field_path = f"{path}.{name}" if path else name
+            if value is None or value == "":
+                if required:
+                    errors.append(f"Missing required field: {field_path}")
+                continue
+            check(value, field_path, errors)
+        return errors
+
+    return validate
+
+
+def compile_field(spec):
+    check, message = TYPES[spec["type"]]
+    gt = spec.get("gt")
+    minimum = spec.get("min")
+    min_items = spec.get("min_items")
+    item_check = compile_field(spec["items"]) if "items" in spec else None
+    object_check = compile_schema(spec["fields"]) if "fields" in spec else None
+
+    def validate(value, path, errors):
+        if not check(value):
+            errors.append(f"{path} {message}")
+            return
+        if gt is not None and value <= gt:
+            errors.append(f"{path} must be greater than {gt}")
+        if minimum is not None and value < minimum:
+            errors.append(f"{path} must be at least {minimum}")
+        if min_items is not None and len(value) < min_items:
+            errors.append(f"{path} must contain at least {min_items} item(s)")
+        if item_check:
+            for idx, item in enumerate(value):
+                item_check(item, f"{path}[{idx}]", errors)
+        if object_check:
+            object_check(value, path, errors)
+
+    return validate